@@ -0,0 +1,305 @@
+import os
+import json
+import pickle
+import hashlib
+import inspect
+import functools
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import make_rankings as rankings
+
+def fingerprint(value):
+    """
+    Returns a hash of the content of value, used to key cached results.
+    DataFrames and Series are hashed by content (values, index, columns and dtypes), arrays by bytes,
+    and strings naming an existing file by the content of the file. Anything else is hashed by repr.
+    """
+    digest = hashlib.sha1()
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest.update(b'frame')
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        columns = value.columns if isinstance(value, pd.DataFrame) else [value.name]
+        digest.update(repr(list(columns)).encode())
+        #Only the dtype names, categoricals are hashed by value so their category lists don't matter
+        dtypes = value.dtypes if isinstance(value, pd.DataFrame) else [value.dtype]
+        digest.update(repr([str(dtype) for dtype in dtypes]).encode())
+
+    elif isinstance(value, np.ndarray):
+        digest.update(b'array')
+        digest.update(repr((value.dtype, value.shape)).encode())
+        digest.update(value.tobytes() if value.dtype != object else repr(value.tolist()).encode())
+
+    elif isinstance(value, str) and os.path.isfile(value):
+        digest.update(b'file')
+        with open(value, 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                digest.update(chunk)
+
+    elif isinstance(value, (tuple, list)):
+        digest.update(b'sequence')
+        for item in value:
+            digest.update(fingerprint(item).encode())
+
+    else:
+        digest.update(repr(value).encode())
+
+    return digest.hexdigest()
+
+def copy_result(result):
+    """
+    Copy of a cached result, so callers can modify what they get without changing the cache
+    """
+    if isinstance(result, (pd.DataFrame, pd.Series, np.ndarray)):
+        return result.copy()
+
+    if isinstance(result, tuple):
+        return tuple(copy_result(item) for item in result)
+
+    return result
+
+def result_frames(result):
+    """
+    DataFrames and Series in a result, which later calls may use as inputs
+    """
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return [result]
+
+    if isinstance(result, tuple):
+        return [item for item in result if isinstance(item, (pd.DataFrame, pd.Series))]
+
+    return []
+
+class AnalysisCache:
+    """
+    Memoizes analysis functions. Results are keyed by the function name and a fingerprint of each
+    argument, so calls on the same data with the same arguments are only computed once.
+    Up to 'max_entries' results are kept in memory (least recently used are evicted first).
+    If 'cache_dir' is given, results are also pickled there and survive restarts. Up to 'max_disk_entries'
+    are kept there, and an index file records their fingerprints and the known source files.
+
+    Each result records the fingerprints of its inputs and outputs. When a source file changes,
+    results computed from its old content are dropped, along with everything computed from their
+    outputs, unless the new content gives the same outputs.
+    """
+
+    def __init__(self, max_entries=128, cache_dir=None, max_disk_entries=1024):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()      #Key --> (result, input fingerprints, output fingerprints)
+        self.disk_entries = OrderedDict() #Key --> (input fingerprints, output fingerprints), of the files in cache_dir
+        self.sources = {}                 #Source file --> fingerprint of its last known content
+        self.index_dir = None             #cache_dir the disk entries were read from
+        self.hits = 0
+        self.misses = 0
+
+        self.load_index()
+
+    def memoize(self, func, ignore=(), on_hit=None):
+        """
+        Returns a cached version of func.
+        Arguments named in 'ignore' don't change the result (eg a profiler) and are left out of the key.
+        If func has side effects (eg saving files), on_hit(result, arguments) is called with every cached
+        result, and the dict of arguments of the call, to repeat them.
+        """
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def cached_func(*args, **kwargs):
+            #Bind defaults too, so f(x) and f(x, top_pos=1) share results
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+
+            inputs = {name: fingerprint(value) for name, value in bound.arguments.items() if name not in ignore}
+            key = hashlib.sha1(repr((func.__module__, func.__qualname__, sorted(inputs.items()))).encode()).hexdigest()
+
+            entry = self.get(key)
+            if entry is not None:
+                self.hits += 1
+                if on_hit is not None:
+                    on_hit(entry[0], bound.arguments)
+                return copy_result(entry[0])
+
+            self.misses += 1
+            result = func(*args, **kwargs)
+            outputs = {fingerprint(frame) for frame in result_frames(result)}
+
+            #Source files whose content changed make the results of their old content stale
+            for name, value in bound.arguments.items():
+                if name in inputs and isinstance(value, str) and os.path.isfile(value):
+                    old_fingerprint = self.sources.get(value)
+                    self.sources[value] = inputs[name]
+                    if old_fingerprint is not None and old_fingerprint != inputs[name]:
+                        self.invalidate(old_fingerprint, keep=outputs)
+
+            self.put(key, (result, set(inputs.values()), outputs))
+            self.save_index()
+
+            return copy_result(result)
+
+        return cached_func
+
+    def get(self, key):
+        """
+        Returns the entry for key, from memory or disk, or None
+        """
+        self.load_index()
+
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        if key in self.disk_entries and os.path.exists(self.disk_file(key)):
+            with open(self.disk_file(key), 'rb') as f:
+                entry = pickle.load(f)
+            self.put(key, entry, write=False)
+            self.disk_entries.move_to_end(key)
+            self.save_index()
+            return entry
+
+        return None
+
+    def put(self, key, entry, write=True):
+        """
+        Stores an entry in memory and on disk, evicting the least recently used from each
+        """
+        self.load_index()
+
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+        if write and self.cache_dir is not None:
+            try:
+                with open(self.disk_file(key), 'wb') as f:
+                    pickle.dump(entry, f)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                #Some results (eg Stylers) can't be pickled, keep them in memory only
+                os.remove(self.disk_file(key))
+                return
+
+            self.disk_entries[key] = (entry[1], entry[2])
+            self.disk_entries.move_to_end(key)
+
+            while len(self.disk_entries) > self.max_disk_entries:
+                old_key, _ = self.disk_entries.popitem(last=False)
+                self.remove_disk_file(old_key)
+
+    def disk_file(self, key):
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+    def remove_disk_file(self, key):
+        if os.path.exists(self.disk_file(key)):
+            os.remove(self.disk_file(key))
+
+    def index_file(self):
+        return os.path.join(self.cache_dir, 'index.json')
+
+    def load_index(self):
+        """
+        Reads the fingerprints of the results on disk and the known source files, the first time cache_dir
+        is used. Results on disk without an index entry can't be invalidated, so they are removed.
+        """
+        if self.cache_dir is None or self.index_dir == self.cache_dir:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.index_dir = self.cache_dir
+        self.disk_entries = OrderedDict()
+
+        if os.path.exists(self.index_file()):
+            with open(self.index_file(), encoding='utf-8') as f:
+                index = json.load(f)
+
+            #Entries are listed from least to most recently used
+            for key, inputs, outputs in index['entries']:
+                if os.path.exists(self.disk_file(key)):
+                    self.disk_entries[key] = (set(inputs), set(outputs))
+            for source, source_fingerprint in index['sources'].items():
+                self.sources.setdefault(source, source_fingerprint)
+
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith('.pkl') and file_name[:-len('.pkl')] not in self.disk_entries:
+                os.remove(os.path.join(self.cache_dir, file_name))
+
+    def save_index(self):
+        """
+        Writes the fingerprints of the results on disk and the known source files to the index file
+        """
+        if self.cache_dir is None:
+            return
+
+        index = {'entries': [[key, sorted(inputs), sorted(outputs)] for key, (inputs, outputs) in self.disk_entries.items()],
+                 'sources': self.sources}
+
+        #Write to a temporary file first, so an interrupted write doesn't lose the index
+        with open(self.index_file() + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(self.index_file() + '.tmp', self.index_file())
+
+    def invalidate(self, stale_fingerprint, keep=()):
+        """
+        Drops every result computed from data with the 'stale_fingerprint', and recursively
+        the results computed from their outputs. Outputs with a fingerprint in 'keep' are
+        still valid, so results computed from them are kept.
+        """
+        self.load_index()
+        stale = [stale_fingerprint]
+
+        while stale:
+            current = stale.pop()
+
+            #Results in memory, and results on disk that may not have been loaded in this session
+            stale_keys = {key for key, (result, inputs, outputs) in self.entries.items() if current in inputs}
+            stale_keys.update(key for key, (inputs, outputs) in self.disk_entries.items() if current in inputs)
+
+            for key in stale_keys:
+                if key in self.entries:
+                    outputs = self.entries.pop(key)[2]
+                if key in self.disk_entries:
+                    outputs = self.disk_entries.pop(key)[1]
+                    self.remove_disk_file(key)
+                stale.extend(output for output in outputs if output not in keep)
+
+        self.save_index()
+
+    def clear(self):
+        """
+        Drops every result, in memory and on disk
+        """
+        for key in list(self.entries):
+            del self.entries[key]
+
+        if self.cache_dir is not None:
+            self.load_index()
+            self.disk_entries.clear()
+            for file_name in os.listdir(self.cache_dir):
+                if file_name.endswith('.pkl'):
+                    os.remove(os.path.join(self.cache_dir, file_name))
+            self.save_index()
+
+def save_cached_rankings(result, arguments):
+    """
+    Saves cached rankings the same way make_rankings does, to the files and the RunStore of the call
+    """
+    freestyle, ta = result
+    rankings.save_rankings(freestyle, 'freestyle', arguments['storage'])
+    rankings.save_rankings(ta, 'ta', arguments['storage'])
+
+    if arguments['store'] is not None:
+        arguments['store'].write_rankings(freestyle, ta)
+
+#Default cache, and cached versions of the analysis functions
+analysis_cache = AnalysisCache()
+
+make_rankings = analysis_cache.memoize(rankings.make_rankings, ignore=('profiler','store'), on_hit=save_cached_rankings)
+filter_by_weapon = analysis_cache.memoize(rankings.filter_by_weapon)
+average_top_runs = analysis_cache.memoize(rankings.average_top_runs)
+make_tiers = analysis_cache.memoize(rankings.make_tiers)
+remove_outliers = analysis_cache.memoize(rankings.remove_outliers)
@@ -0,0 +1,77 @@
+"""
+Benchmark for import time: how long each module takes to import in a fresh interpreter,
+and whether it loads the plotting stack (matplotlib, seaborn).
+
+Usage:
+    python benchmarks/bench_import.py [module ...] [--repeat R] [--details]
+
+By default make_rankings, plot_rankings, gather_speedrun and the batch modules are measured.
+--details prints the slowest direct imports of each module, from python -X importtime.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+#Modules are imported from the repository root
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+default_modules = ['make_rankings','plot_rankings','gather_speedrun','chunked_rankings','run_store',
+                   'leaderboard_index','runner_stats','analysis_cache','pipeline']
+
+#Run in a fresh interpreter: time the import and list the heavy modules it loaded
+timing_script = '''
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [name for name in ['pandas','numpy','matplotlib','seaborn','pyarrow','requests','bs4'] if name in sys.modules]]))
+'''
+
+def time_import(module, repeat=5):
+    """
+    Returns the best import time (s) of module over 'repeat' fresh interpreters, and the heavy modules it loads
+    """
+    times = []
+    for i in range(repeat):
+        output = subprocess.run([sys.executable, '-c', timing_script.format(module=module)], cwd=root,
+                                capture_output=True, text=True, check=True).stdout
+        elapsed, loaded = json.loads(output.strip().splitlines()[-1])
+        times.append(elapsed)
+
+    return (min(times), loaded)
+
+def slowest_imports(module, n=10):
+    """
+    The n slowest direct imports of module (cumulative, in s), from python -X importtime
+    """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=root,
+                            capture_output=True, text=True, check=True).stderr
+
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        #Only the direct imports of the module, each level of nesting is indented by two more spaces
+        if len(name) - len(name.lstrip()) == 3:
+            imports.append((int(cumulative)/1e6, name.strip()))
+
+    return sorted(imports, reverse=True)[:n]
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Benchmark the import time of the modules')
+    arg_parser.add_argument('modules', nargs='*', default=default_modules, help='modules to import')
+    arg_parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per module, the best time is kept')
+    arg_parser.add_argument('--details', action='store_true', help='print the slowest imports of each module')
+    args = arg_parser.parse_args()
+
+    print(f"{'Module':20} {'Import (s)':>11}  Loads")
+    for module in args.modules:
+        elapsed, loaded = time_import(module, args.repeat)
+        print(f"{module:20} {elapsed:>11.3f}  {', '.join(loaded)}")
+
+        if args.details:
+            for cumulative, name in slowest_imports(module):
+                print(f"    {name:32} {cumulative:>7.3f}")
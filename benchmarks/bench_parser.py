@@ -0,0 +1,65 @@
+"""
+Benchmark for IBSpeedrunTableParser: parse time and peak memory per page.
+
+Usage:
+    python benchmarks/bench_parser.py [saved_page.html ...] [--rows N] [--repeat R]
+
+Saved leaderboard pages are benchmarked if given, otherwise a synthetic page with N rows is used.
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+#Make the modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gather_speedrun import IBSpeedrunTableParser
+from generate_data import generate_runs, leaderboard_page
+
+def synthetic_page(n_rows):
+    """
+    Returns a leaderboard page with n_rows runs of one monster, in the same format as https://mhwleaderboards.com/
+    """
+    return leaderboard_page(generate_runs(n_rows, n_monsters=1, seed=0)).encode()
+
+def bench_page(table_parser, content, repeat=3):
+    """
+    Returns the number of rows, best parse time (s) and peak memory (MB) for one page
+    """
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        df = table_parser.parse_page(content)
+        times.append(time.perf_counter() - start)
+
+    #Measure memory separately, tracemalloc slows down parsing
+    tracemalloc.start()
+    table_parser.parse_page(content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return (len(df), min(times), peak/2**20)
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Benchmark the leaderboard table parser')
+    arg_parser.add_argument('pages', nargs='*', help='saved leaderboard pages')
+    arg_parser.add_argument('--rows', type=int, default=20000, help='rows in the synthetic page')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='parses per page, the best time is kept')
+    args = arg_parser.parse_args()
+
+    if args.pages:
+        pages = {}
+        for path in args.pages:
+            with open(path, 'rb') as f:
+                pages[path] = f.read()
+    else:
+        pages = {f'synthetic ({args.rows} rows)': synthetic_page(args.rows)}
+
+    table_parser = IBSpeedrunTableParser()
+
+    print(f"{'Page':40} {'Rows':>8} {'Size (MB)':>10} {'Time (s)':>10} {'Peak (MB)':>10}")
+    for name, content in pages.items():
+        n_rows, parse_time, peak = bench_page(table_parser, content, args.repeat)
+        print(f'{name:40} {n_rows:>8} {len(content)/2**20:>10.2f} {parse_time:>10.3f} {peak:>10.1f}')
@@ -0,0 +1,56 @@
+"""
+Benchmark for the storage backends of make_rankings: file size and load time of the ranked tables.
+
+Usage:
+    python benchmarks/bench_storage.py [speedrun_data.csv] [--scale N] [--repeat R]
+
+The ranked tables are replicated 'scale' times to emulate larger datasets.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import pandas as pd
+
+#Make the modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from make_rankings import make_rankings, save_rankings, load_rankings, storage_extensions
+
+def bench_load(name, storage, repeat=3):
+    """
+    Returns the best load time (s) and the memory used by the loaded dataframe (MB)
+    """
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        df = load_rankings(name, storage)
+        times.append(time.perf_counter() - start)
+
+    return (min(times), df.memory_usage(deep=True).sum()/2**20)
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Benchmark the storage backends of make_rankings')
+    arg_parser.add_argument('csv_file', nargs='?', default='speedrun_data.csv', help='speedrun data to rank')
+    arg_parser.add_argument('--scale', type=int, default=1, help='times the ranked tables are replicated')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='loads per file, the best time is kept')
+    args = arg_parser.parse_args()
+
+    csv_file = os.path.abspath(args.csv_file)
+
+    #Work in a temporary directory, make_rankings saves its output in the working directory
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        tables = dict(zip(['freestyle','ta'], make_rankings(csv_file)))
+
+        print(f"{'Table':10} {'Storage':8} {'Rows':>9} {'Size (MB)':>10} {'Load (s)':>9} {'Memory (MB)':>12}")
+        for table, speed_df in tables.items():
+            speed_df = pd.concat([speed_df]*args.scale, ignore_index=True)
+
+            for storage in storage_extensions:
+                file_name = save_rankings(speed_df, table, storage)
+                load_time, memory = bench_load(table, storage, args.repeat)
+                print(f'{table:10} {storage:8} {len(speed_df):>9} {os.path.getsize(file_name)/2**20:>10.2f} '
+                      f'{load_time:>9.3f} {memory:>12.1f}')
@@ -0,0 +1,184 @@
+"""
+Benchmark suite: wall time and peak memory of the parser and analysis functions on synthetic data,
+compared against a stored baseline.
+
+Usage:
+    python benchmarks/bench_suite.py [--rows 10000 100000 ...] [--repeat R] [--baseline FILE]
+                                     [--save-baseline] [--tolerance T] [--output FILE]
+
+For each number of rows a synthetic dataset is made with generate_data.py and these are timed:
+    parse_page        --> one leaderboard page (at most --page-rows rows)
+    parse_html_table  --> the same page, through BeautifulSoup (at most --soup-rows rows, tree built beforehand)
+    make_rankings     --> the full dataset, from csv
+    filter_by_weapon  --> TA rankings, by quest
+    average_top_runs  --> filtered TA rankings, Quest/Weapon, top 3
+    make_tiers        --> those averages, 7 tiers
+    remove_outliers   --> freestyle rankings
+Results are compared against the baseline for the same number of rows, and a benchmark is flagged
+as a regression if its time or peak memory grew more than --tolerance (exit code 1).
+--save-baseline stores the results as the new baseline.
+
+benchmarks/baseline.json has a baseline for the default --rows (10000 and 100000). Times depend on the
+machine, so on a new machine, or for other --rows, run once with --save-baseline before comparing.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from collections import OrderedDict
+
+#Make the modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+
+from gather_speedrun import IBSpeedrunTableParser
+from make_rankings import (inv_weapon_dict, make_rankings, filter_by_weapon, average_top_runs,
+                           make_tiers, remove_outliers)
+from generate_data import generate_runs, leaderboard_page
+
+#Differences in time below this (s) are noise, never regressions
+min_time_change = 0.01
+
+def measure(func, repeat=3):
+    """
+    Runs func 'repeat' times. Returns its result, the best time (s) and the peak memory (MB)
+    """
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+
+    #Measure memory separately, tracemalloc slows everything down
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return (result, min(times), peak/2**20)
+
+def run_suite(n_rows, repeat=3, page_rows=20000, soup_rows=2000, seed=0):
+    """
+    Runs every benchmark on a synthetic dataset with n_rows runs.
+    Returns {benchmark: {'rows': input rows, 'time': s, 'peak_mb': MB}}
+    """
+    results = OrderedDict()
+
+    def bench(name, func, input_rows):
+        result, best_time, peak = measure(func, repeat)
+        results[name] = {'rows': input_rows, 'time': round(best_time, 4), 'peak_mb': round(peak, 2)}
+        return result
+
+    runs = generate_runs(n_rows, seed=seed)
+    table_parser = IBSpeedrunTableParser()
+
+    #Parser, on pages of a single monster
+    page = leaderboard_page(generate_runs(min(n_rows, page_rows), n_monsters=1, seed=seed)).encode()
+    bench('parse_page', lambda: table_parser.parse_page(page), min(n_rows, page_rows))
+
+    soup_page = leaderboard_page(generate_runs(min(n_rows, soup_rows), n_monsters=1, seed=seed))
+    table = BeautifulSoup(soup_page, 'html.parser').find('table')
+    bench('parse_html_table', lambda: table_parser.parse_html_table(table), min(n_rows, soup_rows))
+
+    #Rankings are saved to the working directory, so work in a temporary one
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        try:
+            runs.to_csv('speedrun_data.csv', index=False)
+            freestyle, ta = bench('make_rankings', lambda: make_rankings('speedrun_data.csv'), n_rows)
+        finally:
+            os.chdir(cwd)
+
+    filtered = bench('filter_by_weapon', lambda: filter_by_weapon(ta, filter_by='Quest'), len(ta))
+
+    avg = bench('average_top_runs', lambda: average_top_runs(filtered, 'Quest/Weapon', top_pos=3), len(filtered))
+    avg['Weapon (long)'] = avg['Weapon'].map(inv_weapon_dict)
+
+    bench('make_tiers', lambda: make_tiers(avg, n_tiers=7), len(avg))
+
+    bench('remove_outliers', lambda: remove_outliers(freestyle), len(freestyle))
+
+    return results
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Returns {benchmark: (time ratio, memory ratio, regressed)} for the benchmarks in the baseline
+    """
+    comparison = OrderedDict()
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+
+        time_ratio = result['time']/base['time'] if base['time'] else float('inf')
+        memory_ratio = result['peak_mb']/base['peak_mb'] if base['peak_mb'] else float('inf')
+
+        slower = time_ratio > 1 + tolerance and result['time'] - base['time'] > min_time_change
+        bigger = memory_ratio > 1 + tolerance
+
+        comparison[name] = (time_ratio, memory_ratio, slower or bigger)
+
+    return comparison
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Benchmark the parser and analysis functions')
+    arg_parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000],
+                            help='dataset sizes, eg 10000 100000 1000000 10000000')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the best time is kept')
+    arg_parser.add_argument('--page-rows', type=int, default=20000, help='rows of the page for parse_page')
+    arg_parser.add_argument('--soup-rows', type=int, default=2000, help='rows of the page for parse_html_table')
+    arg_parser.add_argument('--seed', type=int, default=0, help='random seed of the synthetic data')
+    arg_parser.add_argument('--baseline', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json'),
+                            help='json file with the baseline results')
+    arg_parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    arg_parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative increase in time or memory')
+    arg_parser.add_argument('--output', default=None, help='json file for the results')
+    args = arg_parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    all_results = OrderedDict()
+    regressions = []
+
+    for n_rows in args.rows:
+        results = run_suite(n_rows, repeat=args.repeat, page_rows=args.page_rows, soup_rows=args.soup_rows,
+                            seed=args.seed)
+        all_results[str(n_rows)] = results
+        comparison = compare(results, baselines.get(str(n_rows), {}), args.tolerance)
+
+        print(f'\n{n_rows} rows')
+        if str(n_rows) not in baselines:
+            print(f'No baseline for {n_rows} rows in {args.baseline}, run with --save-baseline to store one')
+        print(f"{'Benchmark':18} {'Rows':>9} {'Time (s)':>9} {'Peak (MB)':>10} {'Time x':>7} {'Mem x':>7}")
+        for name, result in results.items():
+            line = f"{name:18} {result['rows']:>9} {result['time']:>9.3f} {result['peak_mb']:>10.1f}"
+            if name in comparison:
+                time_ratio, memory_ratio, regressed = comparison[name]
+                line += f' {time_ratio:>7.2f} {memory_ratio:>7.2f}'
+                if regressed:
+                    line += '  REGRESSION'
+                    regressions.append((n_rows, name))
+            print(line)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(all_results, f, indent=2)
+
+    if args.save_baseline:
+        baselines.update(all_results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2)
+        print(f'\nBaseline saved to {args.baseline}')
+
+    if regressions:
+        print(f'\n{len(regressions)} regression(s): ' + ', '.join(f'{name} ({n_rows} rows)' for n_rows, name in regressions))
+        sys.exit(1)
@@ -0,0 +1,139 @@
+"""
+Synthetic leaderboard generator, for benchmarks.
+
+Usage:
+    python benchmarks/generate_data.py OUTPUT_CSV [--rows N] [--runners N] [--monsters N] [--quests N]
+                                       [--duplicates RATE] [--pages DIR] [--seed S]
+
+Writes a dataset in the format of speedrun_data.csv and, with --pages, a fake copy of
+https://mhwleaderboards.com/ (main page and one leaderboard page per monster) that gather_speedrun.py
+can scrape from a local http server, eg python -m http.server --directory DIR.
+"""
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+#Make the modules in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from make_rankings import weapon_dict, to_time_string
+
+#Relative speed of each weapon, fastest first (roughly as on the real leaderboards)
+weapon_speed = {'Heavy Bowgun':1.0,'Bow':1.25,'Great Sword':1.35,'Light Bowgun':1.4,'Dual Blades':1.45,
+                'Sword And Shield':1.5,'Switch Axe':1.5,'Charge Blade':1.55,'Long Sword':1.6,'Hammer':1.6,
+                'Gunlance':1.65,'Insect Glaive':1.7,'Lance':1.9,'Hunting Horn':1.9}
+
+def generate_runs(n_rows, n_runners=None, n_monsters=60, quests_per_monster=3, weapons=None,
+                  duplicate_rate=0.3, ta_rate=0.45, seed=0):
+    """
+    Returns n_rows synthetic runs in the format of speedrun_data.csv.
+    Runner activity follows a power law, so a few runners submit most runs, and 'duplicate_rate' of the
+    rows are slower repeat runs of an earlier run (same monster, quest, runner and weapon).
+    Active runners also repeat runs by chance, so the actual rate of duplicates is a bit higher.
+    Rows of each monster are together and sorted by time, like the pages of the leaderboards.
+    """
+    rng = np.random.default_rng(seed)
+    weapons = list(weapons if weapons is not None else weapon_dict)
+    n_runners = n_runners or max(n_rows // 20, 10)
+    n_quests = n_monsters * quests_per_monster
+
+    #Runs that are not repeats
+    n_unique = n_rows - int(n_rows * duplicate_rate)
+
+    monster = rng.integers(0, n_monsters, n_unique)
+    quest = monster * quests_per_monster + rng.integers(0, quests_per_monster, n_unique)
+    runner = (n_runners * rng.random(n_unique)**3).astype(np.int64)
+    weapon = rng.integers(0, len(weapons), n_unique)
+
+    #Each runner mostly uses the same weapon
+    main_weapon = rng.integers(0, len(weapons), n_runners)
+    weapon = np.where(rng.random(n_unique) < 0.7, main_weapon[runner], weapon)
+
+    #Time = quest base time * weapon speed * runner skill * noise
+    quest_time = rng.uniform(90, 900, n_quests)
+    runner_skill = rng.lognormal(0.25, 0.2, n_runners)
+    speed = np.array([weapon_speed.get(name, 1.5) for name in weapons])
+    seconds = quest_time[quest] * speed[weapon] * runner_skill[runner] * rng.uniform(0.95, 1.15, n_unique)
+
+    #Repeat runs: slower times of earlier runs
+    repeats = rng.integers(0, n_unique, n_rows - n_unique)
+    monster = np.concatenate([monster, monster[repeats]])
+    quest = np.concatenate([quest, quest[repeats]])
+    runner = np.concatenate([runner, runner[repeats]])
+    weapon = np.concatenate([weapon, weapon[repeats]])
+    seconds = np.concatenate([seconds, seconds[repeats] * rng.uniform(1.0, 1.3, len(repeats))])
+
+    monster_names = np.array([f'Monster {i}' for i in range(n_monsters)], dtype=object)
+    star_ratings = rng.integers(4, 7, n_monsters)
+
+    runs = pd.DataFrame({'Star Rating': star_ratings[monster],
+                         'Monster': monster_names[monster],
+                         'Quest': np.array([f'Quest {i}' for i in range(n_quests)], dtype=object)[quest],
+                         'Runner': np.array([f'Runner {i}' for i in range(n_runners)], dtype=object)[runner],
+                         'Time (s)': np.round(seconds, 2),
+                         'Weapon': np.array(weapons, dtype=object)[weapon],
+                         'Platform': np.where(rng.random(n_rows) < 0.8, 'PC', 'PS4'),
+                         'Ruleset': np.where(rng.random(n_rows) < ta_rate, 'TA Rules', 'Freestyle')})
+
+    #Monsters together, each sorted by time
+    runs = runs.sort_values(['Monster','Time (s)'], kind='stable').reset_index(drop=True)
+    runs.insert(4, 'Time', to_time_string(runs.pop('Time (s)')))
+
+    return runs
+
+def leaderboard_page(mon_df):
+    """
+    Returns the html of a leaderboard page with the runs of one monster
+    """
+    icons = mon_df['Weapon'].str.lower().str.replace(' ', '-')
+    rows = ('<tr><td>' + mon_df['Quest'] + '</td><td>' + mon_df['Runner'] + '</td><td>' + mon_df['Time']
+            + '</td><td><img src="/static/weapon-icon/' + icons + '.png"></td><td>' + mon_df['Platform']
+            + '</td><td>' + mon_df['Ruleset'] + '</td></tr>')
+
+    header = '<tr><th>Quest</th><th>Runner</th><th>Time</th><th>Weapon</th><th>Platform</th><th>Ruleset</th></tr>'
+
+    return f'<html><body><table>{header}{"".join(rows)}</table></body></html>'
+
+def write_pages(runs, page_dir):
+    """
+    Writes a fake copy of the leaderboards for 'runs' to page_dir: index.html, with the monsters
+    grouped by star rating, and one page per monster in page_dir/monster/
+    """
+    os.makedirs(os.path.join(page_dir, 'monster'), exist_ok=True)
+
+    categories = []
+    for star_rating, star_df in runs.groupby('Star Rating', sort=False):
+        links = []
+        for monster, mon_df in star_df.groupby('Monster', sort=False):
+            page_name = monster.lower().replace(' ', '-')
+            links.append(f'<li class=""><a href="/monster/{page_name}">{monster} (MR 24)</a></li>')
+
+            with open(os.path.join(page_dir, 'monster', page_name), 'w', encoding='utf-8') as f:
+                f.write(leaderboard_page(mon_df))
+
+        categories.append(f'<div class="{star_rating}-star"><h5>{star_rating} Star</h5><ul>{"".join(links)}</ul></div>')
+
+    with open(os.path.join(page_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(f'<html><body>{"".join(categories)}</body></html>')
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Generate synthetic speedrun data')
+    arg_parser.add_argument('output', help='csv file for the runs')
+    arg_parser.add_argument('--rows', type=int, default=100000, help='number of runs')
+    arg_parser.add_argument('--runners', type=int, default=None, help='number of runners (default: rows/20)')
+    arg_parser.add_argument('--monsters', type=int, default=60, help='number of monsters')
+    arg_parser.add_argument('--quests', type=int, default=3, help='quests per monster')
+    arg_parser.add_argument('--duplicates', type=float, default=0.3, help='fraction of repeat runs')
+    arg_parser.add_argument('--pages', default=None, help='directory for a fake copy of the leaderboards')
+    arg_parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = arg_parser.parse_args()
+
+    runs = generate_runs(args.rows, n_runners=args.runners, n_monsters=args.monsters,
+                         quests_per_monster=args.quests, duplicate_rate=args.duplicates, seed=args.seed)
+    runs.to_csv(args.output, index=False)
+
+    if args.pages is not None:
+        write_pages(runs, args.pages)
@@ -0,0 +1,196 @@
+"""
+Out-of-core rankings, for speedrun data larger than memory.
+
+Usage:
+    python chunked_rankings.py [--data speedrun_data.csv] [--chunk-rows N] [--partitions N] [--profile FILE]
+
+Gives the same freestyle.csv and ta.csv as make_rankings, in four steps:
+    keys      --> the csv is streamed once, reading only Monster and Quest. Monsters sharing a quest
+                  are joined, so every rank group (monster, quest, and their weapons) falls in one
+                  partition, and these groups are spread over the partitions by size.
+    spill     --> the csv is streamed again in chunks, and each row is appended to the spill file
+                  of its partition, keeping the original order of the rows.
+    rank      --> each partition is loaded on its own, deduplicated, ranked and split into one block
+                  file per monster (and star rating), for freestyle and TA.
+    merge     --> block files are concatenated in the order of sort_runs.
+Peak memory depends on the chunk size and the largest partition, not on the whole dataset.
+"""
+import os
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import Profiler, null_profiler
+from make_rankings import category_columns, prepare_runs, rank_runs, assemble_rankings
+
+def partition_monsters(csv_file, chunk_rows=1000000, n_partitions=64):
+    """
+    Streams the Monster and Quest columns of csv_file and assigns every monster to a partition.
+    Monsters sharing a quest get the same partition, and partitions are balanced by number of runs.
+    Returns {monster: partition}.
+    """
+    #Runs for each (monster, quest) pair
+    pair_counts = {}
+    for chunk in pd.read_csv(csv_file, usecols=['Monster','Quest'], dtype=str, keep_default_na=False,
+                             chunksize=chunk_rows):
+        for pair, count in chunk.value_counts(sort=False).items():
+            pair_counts[pair] = pair_counts.get(pair, 0) + count
+
+    #Join monsters that share a quest (union-find)
+    parent = {}
+
+    def find(monster):
+        while parent.setdefault(monster, monster) != monster:
+            parent[monster] = parent[parent[monster]]
+            monster = parent[monster]
+        return monster
+
+    quest_monster = {}
+    for monster, quest in pair_counts:
+        other = quest_monster.setdefault(quest, monster)
+        parent[find(monster)] = find(other)
+
+    component_sizes = {}
+    for (monster, quest), count in pair_counts.items():
+        component = find(monster)
+        component_sizes[component] = component_sizes.get(component, 0) + count
+
+    #Largest components first, each to the partition with the fewest runs so far
+    partition_sizes = np.zeros(n_partitions, dtype=np.int64)
+    component_partition = {}
+    for component, size in sorted(component_sizes.items(), key=lambda item: item[1], reverse=True):
+        partition = int(np.argmin(partition_sizes))
+        component_partition[component] = partition
+        partition_sizes[partition] += size
+
+    return {monster: component_partition[find(monster)] for monster in parent}
+
+def spill_partitions(csv_file, monster_partition, tmp_dir, chunk_rows=1000000):
+    """
+    Streams csv_file in chunks and appends every row, unchanged, to the spill file of its partition.
+    Returns {partition: spill file}.
+    """
+    spill_files = {}
+
+    for chunk in pd.read_csv(csv_file, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+        partitions = chunk['Monster'].map(monster_partition).to_numpy()
+
+        for partition, part_df in chunk.groupby(partitions, sort=False):
+            new_file = partition not in spill_files
+            if new_file:
+                spill_files[partition] = os.path.join(tmp_dir, f'part-{partition}.csv')
+
+            part_df.to_csv(spill_files[partition], mode='w' if new_file else 'a', header=new_file, index=False)
+
+    return spill_files
+
+def rank_partition(spill_file, tmp_dir, partition):
+    """
+    Ranks the runs of one spill file, the same way as make_rankings, and writes the freestyle and TA
+    runs of each (Star Rating, Monster) block to their own files, without header.
+    Returns the column names of freestyle and ta, and {(star rating, monster): (freestyle file, ta file)}.
+    """
+    freestyle = pd.read_csv(spill_file, dtype={column:'category' for column in category_columns})
+    freestyle = prepare_runs(freestyle)
+
+    is_ta = freestyle['Ruleset']=='TA Rules'
+    ta_ranks = rank_runs(freestyle, mask=is_ta)
+    freestyle_ranks = rank_runs(freestyle)
+    freestyle, ta = assemble_rankings(freestyle, freestyle_ranks, ta_ranks)
+
+    #TA runs keep the order of freestyle, so their blocks are found from the block of each freestyle run
+    block_keys = ['Star Rating','Monster']
+    block_numbers = freestyle.groupby(block_keys, sort=False, observed=True, dropna=False).ngroup().to_numpy()
+    keys = list(freestyle[block_keys].drop_duplicates().itertuples(index=False, name=None))
+
+    freestyle_blocks = dict(iter(freestyle.groupby(block_numbers, sort=False)))
+    ta_blocks = dict(iter(ta.groupby(block_numbers[is_ta.to_numpy()], sort=False)))
+
+    blocks = {}
+    for number, key in enumerate(keys):
+        block_files = (os.path.join(tmp_dir, f'block-{partition}-{number}-freestyle.csv'),
+                       os.path.join(tmp_dir, f'block-{partition}-{number}-ta.csv'))
+
+        freestyle_blocks[number].to_csv(block_files[0], header=False, index=False)
+        ta_blocks.get(number, ta.iloc[:0]).to_csv(block_files[1], header=False, index=False)
+
+        blocks[key] = block_files
+
+    return (list(freestyle.columns), list(ta.columns), blocks)
+
+def ordered_blocks(blocks):
+    """
+    (Star Rating, Monster) keys of the blocks in the order of sort_runs:
+    star ratings descending, then monsters ascending, with missing values last
+    """
+    keys = sorted(blocks, key=lambda key: (pd.isna(key[1]), '' if pd.isna(key[1]) else key[1]))
+
+    #Stable, so monsters stay in order for each star rating
+    return (sorted([key for key in keys if not pd.isna(key[0])], key=lambda key: key[0], reverse=True)
+            + [key for key in keys if pd.isna(key[0])])
+
+def merge_blocks(blocks, columns, output_file, table):
+    """
+    Writes the header and then the blocks of 'table' (0 for freestyle, 1 for ta) in block order
+    """
+    with open(output_file, 'w', encoding='utf-8', newline='') as output:
+        pd.DataFrame(columns=columns).to_csv(output, index=False)
+        for key in ordered_blocks(blocks):
+            with open(blocks[key][table], encoding='utf-8', newline='') as block:
+                shutil.copyfileobj(block, output)
+
+def make_rankings_chunked(csv_file, chunk_rows=1000000, n_partitions=64, output_dir='.', tmp_dir=None,
+                          profiler=null_profiler):
+    """
+    Creates the freestyle and ta rankings of make_rankings from csv_file without loading it whole.
+    The csv is read 'chunk_rows' rows at a time and split into 'n_partitions' spill files in tmp_dir
+    (a temporary directory if None), which are ranked one at a time.
+    Rankings are saved as csv files in output_dir. Returns the names of the freestyle and ta files.
+    """
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as spill_dir:
+        with profiler.stage('keys') as record:
+            monster_partition = partition_monsters(csv_file, chunk_rows, n_partitions)
+            record['rows'] = len(monster_partition)
+
+        with profiler.stage('spill'):
+            spill_files = spill_partitions(csv_file, monster_partition, spill_dir, chunk_rows)
+
+        blocks = {}
+        for partition, spill_file in spill_files.items():
+            with profiler.stage('rank', partition=partition) as record:
+                freestyle_columns, ta_columns, partition_blocks = rank_partition(spill_file, spill_dir, partition)
+                blocks.update(partition_blocks)
+                record['bytes'] = os.path.getsize(spill_file)
+            os.remove(spill_file)
+
+        output_files = (os.path.join(output_dir, 'freestyle.csv'), os.path.join(output_dir, 'ta.csv'))
+        with profiler.stage('merge'):
+            merge_blocks(blocks, freestyle_columns, output_files[0], 0)
+            merge_blocks(blocks, ta_columns, output_files[1], 1)
+
+    return output_files
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Make speedrun rankings without loading all the data at once')
+    arg_parser.add_argument('--data', default='speedrun_data.csv', help='csv file with the speedrun data')
+    arg_parser.add_argument('--chunk-rows', type=int, default=1000000, help='rows read from the csv at a time')
+    arg_parser.add_argument('--partitions', type=int, default=64, help='number of spill partitions')
+    arg_parser.add_argument('--output-dir', default='.', help='directory for freestyle.csv and ta.csv')
+    arg_parser.add_argument('--tmp-dir', default=None, help='directory for the spill files')
+    arg_parser.add_argument('--profile', default=None, help='json file for the stage timings (also prints a summary)')
+    arg_parser.add_argument('--tracemalloc', action='store_true', help='record the peak memory of each stage')
+    args = arg_parser.parse_args()
+
+    profiler = Profiler(enabled=args.profile is not None, memory=args.tracemalloc)
+
+    profiler.start()
+    make_rankings_chunked(args.data, chunk_rows=args.chunk_rows, n_partitions=args.partitions,
+                          output_dir=args.output_dir, tmp_dir=args.tmp_dir, profiler=profiler)
+    profiler.stop()
+
+    if args.profile is not None:
+        profiler.save(args.profile)
+        print(profiler.table())
@@ -1,72 +1,438 @@
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, UnicodeDammit
+from html.parser import HTMLParser
 import pandas as pd
 import time
+import threading
+import argparse
+import hashlib
+import json
+import os
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from instrumentation import Profiler, null_profiler
+
+class TokenBucket:
+        """
+        Thread safe token bucket. Allows on average 'rate' requests per second,
+        with bursts of up to 'capacity' requests.
+        """
+
+        def __init__(self, rate, capacity=1):
+            self.rate = rate
+            self.capacity = capacity
+            self.tokens = capacity
+            self.last_time = time.monotonic()
+            self.lock = threading.Lock()
+
+        def acquire(self):
+            """
+            Blocks until a token is available, then consumes it
+            """
+            while True:
+                with self.lock:
+                    #Refill tokens for the time elapsed since the last call
+                    now = time.monotonic()
+                    self.tokens = min(self.capacity, self.tokens + (now - self.last_time)*self.rate)
+                    self.last_time = now
+
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+
+                    #Time until the next token is available
+                    wait = (1 - self.tokens)/self.rate
+
+                time.sleep(wait)
+
+class HostRateLimiter:
+        """
+        Keeps one TokenBucket per host, so each server gets its own rate limit.
+        """
+
+        def __init__(self, rate, capacity=1):
+            self.rate = rate
+            self.capacity = capacity
+            self.buckets = {}
+            self.lock = threading.Lock()
+
+        def wait(self, url):
+            """
+            Blocks until a request to the host of 'url' is allowed
+            """
+            host = urlparse(url).netloc
+
+            with self.lock:
+                if host not in self.buckets:
+                    self.buckets[host] = TokenBucket(self.rate, self.capacity)
+                bucket = self.buckets[host]
+
+            bucket.acquire()
+
+def make_session(max_connections=4, retries=3, backoff=1.0):
+    """
+    Creates a requests Session that reuses up to 'max_connections' connections per host
+    and retries failed requests 'retries' times, with exponential backoff starting at 'backoff' seconds.
+    """
+    retry = Retry(total=retries,
+                  backoff_factor=backoff,
+                  status_forcelist=[429,500,502,503,504],
+                  allowed_methods=['GET'])
+    adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+class PageCache:
+        """
+        On-disk cache of downloaded pages, keyed by URL.
+        For each page it stores the content, its ETag/Last-Modified headers and a hash of the content,
+        in 'cache_dir'. Thread safe.
+        A page whose content changed is only kept in memory until its rows are stored (or it is committed),
+        so a crawl that fails halfway never records a page without the rows parsed from it.
+        """
+
+        def __init__(self, cache_dir='.page_cache'):
+            self.cache_dir = cache_dir
+            self.index_file = os.path.join(cache_dir, 'index.json')
+            self.lock = threading.Lock()
+
+            #Changed pages waiting for their rows: url --> (index entry, content)
+            self.pending = {}
+
+            os.makedirs(os.path.join(cache_dir, 'pages'), exist_ok=True)
+
+            #Load the index of cached pages, if there is one
+            if os.path.exists(self.index_file):
+                with open(self.index_file) as f:
+                    self.index = json.load(f)
+            else:
+                self.index = {}
+
+        def page_file(self, url):
+            """
+            File storing the content of the page at 'url'
+            """
+            return os.path.join(self.cache_dir, 'pages', hashlib.sha1(url.encode()).hexdigest() + '.html')
+
+        def conditional_headers(self, url):
+            """
+            Headers for a conditional GET of 'url', based on the cached ETag/Last-Modified
+            """
+            headers = {}
+
+            with self.lock:
+                entry = self.index.get(url)
+
+            if entry is not None and os.path.exists(self.page_file(url)):
+                if entry['etag']:
+                    headers['If-None-Match'] = entry['etag']
+                if entry['last_modified']:
+                    headers['If-Modified-Since'] = entry['last_modified']
+
+            return headers
+
+        def load(self, url):
+            """
+            Returns the cached content of 'url'
+            """
+            with open(self.page_file(url), 'rb') as f:
+                return f.read()
+
+        def store(self, url, content, etag=None, last_modified=None):
+            """
+            Stores the content of 'url'. Returns True if the content changed since it was last stored.
+            A changed page is only written once it is committed, see commit and store_rows.
+            """
+            content_hash = hashlib.sha256(content).hexdigest()
+            new_entry = {'etag':etag, 'last_modified':last_modified, 'hash':content_hash}
+
+            with self.lock:
+                entry = self.index.get(url)
+                changed = entry is None or entry['hash'] != content_hash
+
+                if changed:
+                    self.pending[url] = (new_entry, content)
+                else:
+                    #Same content, the stored rows are still valid
+                    self.index[url] = new_entry
+
+            return changed
+
+        def commit(self, url):
+            """
+            Writes the content of 'url' given to store and records it in the index, if it changed
+            """
+            with self.lock:
+                entry, content = self.pending.pop(url, (None, None))
+
+            if entry is None:
+                return
+
+            with open(self.page_file(url), 'wb') as f:
+                f.write(content)
+
+            with self.lock:
+                self.index[url] = entry
+
+        def rows_file(self, url):
+            """
+            File storing the rows parsed from the page at 'url'
+            """
+            return self.page_file(url)[:-len('.html')] + '.csv'
+
+        def load_rows(self, url):
+            """
+            Returns the rows parsed from the cached page at 'url', or None if they were never stored
+            """
+            if not os.path.exists(self.rows_file(url)):
+                return None
+
+            return pd.read_csv(self.rows_file(url), dtype=str, keep_default_na=False)
+
+        def store_rows(self, url, mon_df):
+            """
+            Stores the rows parsed from the page at 'url', then commits the page
+            """
+            mon_df.to_csv(self.rows_file(url), index=False)
+            self.commit(url)
+
+        def save(self):
+            """
+            Writes the index of cached pages to disk
+            """
+            with self.lock:
+                with open(self.index_file, 'w') as f:
+                    json.dump(self.index, f, indent=1)
+
+class LeaderboardTableHandler(HTMLParser):
+        """
+        Event based parser for the first table of a page. Reads the page in a single pass, without
+        building a tree, and collects the column titles and a list of values for each column.
+        Cells without text are read as weapon icons, converted by 'get_weapon_type'.
+        """
+
+        def __init__(self, get_weapon_type):
+            super().__init__()
+            self.get_weapon_type = get_weapon_type
+            self.column_names = []
+            self.column_lists = []
+            self.table_depth = 0
+            self.done = False
+
+            #Values of the current row, text pieces and icon of the current cell
+            self.row = None
+            self.cell = None
+            self.icon = None
+
+        def handle_starttag(self, tag, attrs):
+            if self.done:
+                return
+
+            if tag == 'table':
+                self.table_depth += 1
+
+            elif self.table_depth == 0:
+                return
+
+            #Closing tags for rows and cells are optional in html
+            elif tag == 'tr':
+                self.end_row()
+                self.row = {'td':[], 'th':[]}
+
+            elif tag in ('td','th'):
+                self.end_cell()
+                if self.row is None:
+                    self.row = {'td':[], 'th':[]}
+                self.cell = (tag, [])
+                self.icon = None
+
+            elif tag == 'img' and self.cell is not None and self.icon is None:
+                self.icon = dict(attrs).get('src')
+
+        def handle_endtag(self, tag):
+            if self.done or self.table_depth == 0:
+                return
+
+            if tag in ('td','th'):
+                self.end_cell()
+
+            elif tag == 'tr':
+                self.end_row()
+
+            elif tag == 'table':
+                self.table_depth -= 1
+                if self.table_depth == 0:
+                    self.end_row()
+                    self.done = True
+
+        def handle_data(self, data):
+            if self.cell is not None:
+                self.cell[1].append(data)
+
+        def end_cell(self):
+            if self.cell is None:
+                return
+
+            tag, pieces = self.cell
+            text = ''.join(pieces)
+
+            if tag == 'th':
+                self.row['th'].append(text)
+            elif (text != ''):
+                self.row['td'].append(text.replace('\n',''))
+            else:
+                self.row['td'].append(self.get_weapon_type(self.icon))
+
+            self.cell = None
+
+        def end_row(self):
+            self.end_cell()
+            if self.row is None:
+                return
+
+            # Handle column names if we find them
+            if len(self.column_names) == 0:
+                self.column_names = self.row['th']
+
+            td_values = self.row['td']
+            if len(td_values) > 0:
+                # Set the number of columns for our table from the first row with data
+                if len(self.column_lists) == 0:
+                    self.column_lists = [[] for value in td_values]
+
+                for column_list, value in zip(self.column_lists, td_values):
+                    column_list.append(value)
+
+                # Pad short rows so all columns keep the same length
+                for column_list in self.column_lists[len(td_values):]:
+                    column_list.append(None)
+
+            self.row = None
 
 class IBSpeedrunTableParser:
-       
-        def parse_url(self, url):
-            response = requests.get(url)
-            soup = BeautifulSoup(response.content, "html.parser")
-            
-            #Find table
-            table=soup.find('table')
-            
+
+        def __init__(self, session=None, rate_limiter=None, timeout=30, cache=None):
+            self.session = session if session is not None else make_session()
+            self.rate_limiter = rate_limiter
+            self.timeout = timeout
+            self.cache = cache
+
+        def fetch_page(self, url):
+            """
+            Downloads a page, respecting the rate limiter, and returns its content
+            """
+            return self.fetch_if_changed(url)[0]
+
+        def fetch_if_changed(self, url):
+            """
+            Downloads a page, respecting the rate limiter. Returns its content and whether it changed.
+            With a cache, a conditional GET is sent and unchanged pages are loaded from the cache.
+            Without a cache, pages always count as changed.
+            """
+            if self.rate_limiter is not None:
+                self.rate_limiter.wait(url)
+
+            headers = self.cache.conditional_headers(url) if self.cache is not None else {}
+
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+
+            #Not modified since the cached version
+            if response.status_code == 304:
+                return (self.cache.load(url), False)
+
+            response.raise_for_status()
+
+            if self.cache is None:
+                return (response.content, True)
+
+            changed = self.cache.store(url, response.content,
+                                       etag=response.headers.get('ETag'),
+                                       last_modified=response.headers.get('Last-Modified'))
+
+            return (response.content, changed)
+
+        def parse_page(self, content):
+            """
+            Parses the first table in a downloaded page, in a single pass over the html events.
+            Gives the same result as parse_html_table, without building a tree of the page.
+            """
+            handler = LeaderboardTableHandler(self.get_weapon_type)
+            handler.feed(UnicodeDammit(content).unicode_markup)
+            handler.close()
+
             #Return as a dataframe
-            return self.parse_html_table(table)
+            return self.make_dataframe(handler.column_names, handler.column_lists)
+
+        def parse_url(self, url):
+            return self.parse_page(self.fetch_page(url))
     
         def parse_html_table(self,table):
-            n_columns = 0
-            n_rows=0
+            """
+            Reads the table in a single pass over its rows, building each column as a list,
+            then creates the DataFrame once at the end
+            """
             column_names = []
-            
-            # Find number of rows and columns
-            # we also find the column titles if we can
+            column_lists = []
+
             for row in table.find_all('tr'):
-                
-                # Determine the number of rows in the table
-                td_tags = row.find_all('td')
-                if len(td_tags) > 0:
-                    n_rows+=1
-                    if n_columns == 0:
-                        # Set the number of columns for our table
-                        n_columns = len(td_tags)
-                        
+
                 # Handle column names if we find them
-                th_tags = row.find_all('th') 
-                if len(th_tags) > 0 and len(column_names) == 0:
-                    for th in th_tags:
-                        column_names.append(th.get_text())
-    
+                if len(column_names) == 0:
+                    column_names = [th.get_text() for th in row.find_all('th')]
+
+                td_tags = row.find_all('td')
+                if len(td_tags) == 0:
+                    continue
+
+                # Set the number of columns for our table from the first row with data
+                if len(column_lists) == 0:
+                    column_lists = [[] for td in td_tags]
+
+                for column_list, column in zip(column_lists, td_tags):
+                    text = column.get_text()
+                    if (text != ''):
+                        column_list.append(text.replace('\n',''))
+                    else:
+                        column_list.append(self.get_weapon_type(column))
+
+                # Pad short rows so all columns keep the same length
+                for column_list in column_lists[len(td_tags):]:
+                    column_list.append(None)
+
+            return self.make_dataframe(column_names, column_lists)
+
+        def make_dataframe(self, column_names, column_lists):
+            """
+            Creates the DataFrame for a table, from its column titles and a list of values for each column
+            """
+            n_columns = len(column_lists)
+            n_rows = len(column_lists[0]) if n_columns > 0 else 0
+
             # Safeguard on Column Titles
             if len(column_names) > 0 and len(column_names) != n_columns:
                 raise Exception("Column titles do not match the number of columns")
-    
+
             columns = column_names if len(column_names) > 0 else range(0,n_columns)
-            df = pd.DataFrame(columns = columns,
-                              index= range(0,n_rows))
-            row_marker = 0
-            for row in table.find_all('tr'):
-                column_marker = 0
-                columns = row.find_all('td')
-                for column in columns:
-                    if (column.get_text() != ''):
-                        df.iat[row_marker,column_marker] = column.get_text().replace('\n','')
-                    else:
-                        df.iat[row_marker,column_marker] = self.get_weapon_type(column)
-                    column_marker += 1
-                if len(columns) > 0:
-                    row_marker += 1
-            
+            df = pd.DataFrame(dict(enumerate(column_lists)), index=range(0,n_rows), dtype=object)
+            df.columns = columns
+
             return df
 
         def get_weapon_type(self,column):
             """
-            Gets the weapon type from img src for the weapon column
+            Gets the weapon type from img src for the weapon column.
+            'column' is either the td tag of the column or the img src itself.
             """
             
             #Weapon name as a link in the form '/static/weapon-icon/weapon-name.png'
-            weapon_name = column.find('img')['src']
+            weapon_name = column if isinstance(column,str) else column.find('img')['src']
             
             #Weapon name as 'weapon-name.png'
             weapon_name= weapon_name.split('/')[3]
@@ -79,72 +445,292 @@ class IBSpeedrunTableParser:
             
             return weapon_name
 
-#Getting links to all monster pages from the main page
+class StreamingCsvWriter:
+        """
+        Writes each monster's rows to a csv file as soon as they are parsed, in the order of 'monsters'.
+        Rows go to 'output_file.partial' and every monster written is recorded in 'output_file.progress',
+        so an interrupted crawl can resume from the last monster written. output_file is only replaced
+        once every monster has been written.
+        """
 
-main_url = 'https://mhwleaderboards.com/'
+        def __init__(self, output_file, monsters, resume=True):
+            self.output_file = output_file
+            self.partial_file = output_file + '.partial'
+            self.progress_file = output_file + '.progress'
+            self.monsters = list(monsters)
 
-main_page = requests.get(main_url)
+            #Rows parsed out of order, waiting for the monsters before them
+            self.pending = {}
 
-soup = BeautifulSoup(main_page.content, "html.parser")
+            #Monsters already written by an interrupted crawl, with the file size after each of them
+            written = []
+            if resume and os.path.exists(self.partial_file) and os.path.exists(self.progress_file):
+                with open(self.progress_file, encoding='utf-8') as f:
+                    written = [line.rstrip('\n').split('\t', 1) for line in f if line.endswith('\n')]
 
-#Get categories (6*, 5*, etc)
-monster_categories = soup.find_all('div',{'class': lambda L: L and L.endswith('star')})
+                #Only resume if the same monsters were being gathered, in the same order
+                if [monster for size, monster in written] != self.monsters[:len(written)]:
+                    written = []
 
-#Get amount of monsters to initialize dataframe
-monster_count = len(soup.find_all('li',{'class':''}))
+            self.next_position = len(written)
+            size = int(written[-1][0]) if written else 0
 
-link_df = pd.DataFrame(columns=['Monster','Star Rating','Link'],index=range(0,monster_count))
+            #Drop rows written after the last recorded monster
+            with open(self.partial_file, 'ab') as f:
+                f.truncate(size)
 
-count=0
-for category in monster_categories:
-    
-    #List of monsters in the current star category
-    monster_list = category.find_all('li',{'class':''})
-    
-    #Cycle through all monsters in the category
-    for monster in monster_list:
-        #Full Monster
-        full_name = monster.get_text()
-
-        #Check for Safi'Jiiva (Full Energy)
-        if ('Full Energy' in full_name):
-            link_df.at[count,'Monster'] = "Safi'jiiva (Full Energy)" #Only exception
-        else: #All other Monsters
-            link_df.at[count,'Monster'] = monster.get_text().split('(')[0] #Monster + space before parenthesis
-            link_df.at[count,'Monster'] = link_df.at[count,'Monster'][:-1] #Remove space
+            with open(self.progress_file, 'w', encoding='utf-8') as f:
+                f.writelines(f'{size}\t{monster}\n' for size, monster in written)
+
+        def written(self):
+            """
+            Monsters already written to the partial file
+            """
+            return self.monsters[:self.next_position]
+
+        def add(self, position, mon_df):
+            """
+            Adds the rows of the monster at 'position' in 'monsters', and writes every monster
+            that is next in order
+            """
+            self.pending[position] = mon_df
+
+            while self.next_position in self.pending:
+                mon_df = self.pending.pop(self.next_position)
+
+                with open(self.partial_file, 'a', encoding='utf-8', newline='') as f:
+                    #Write the header with the first monster only
+                    mon_df.to_csv(f, header=f.tell() == 0, index=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    size = f.tell()
+
+                #Record the monster only after its rows are safely on disk
+                with open(self.progress_file, 'a', encoding='utf-8') as f:
+                    f.write(f'{size}\t{self.monsters[self.next_position]}\n')
+
+                self.next_position += 1
+
+        def close(self):
+            """
+            Replaces output_file with the partial file, once every monster was written
+            """
+            if self.next_position < len(self.monsters):
+                raise Exception("Not all monsters were written, the crawl can be resumed")
+
+            os.replace(self.partial_file, self.output_file)
+            os.remove(self.progress_file)
+
+def get_monster_links(table_parser, main_url='https://mhwleaderboards.com/'):
+    """
+    Gets links to all monster pages from the main page.
+    Returns a DataFrame with the Monster, Star Rating and Link for each monster.
+    """
+
+    return parse_monster_links(table_parser.fetch_page(main_url), main_url)
+
+def parse_monster_links(main_page, main_url='https://mhwleaderboards.com/'):
+    """
+    Gets links to all monster pages from the content of the main page.
+    Returns a DataFrame with the Monster, Star Rating and Link for each monster.
+    """
+
+    soup = BeautifulSoup(main_page, "html.parser")
+
+    #Get categories (6*, 5*, etc)
+    monster_categories = soup.find_all('div',{'class': lambda L: L and L.endswith('star')})
+
+    #Get amount of monsters to initialize dataframe
+    monster_count = len(soup.find_all('li',{'class':''}))
+
+    link_df = pd.DataFrame(columns=['Monster','Star Rating','Link'],index=range(0,monster_count))
+
+    count=0
+    for category in monster_categories:
         
-        #Star Rating
-        link_df.at[count,'Star Rating'] = category.find('h5').get_text()[0] #First character is the star rating
+        #List of monsters in the current star category
+        monster_list = category.find_all('li',{'class':''})
         
-        #Link
-        link_df.at[count,'Link'] = main_url[:-1]+monster.find('a')['href'] #Main URL + link for each monster
-        count += 1
+        #Cycle through all monsters in the category
+        for monster in monster_list:
+            #Full Monster
+            full_name = monster.get_text()
+
+            #Check for Safi'Jiiva (Full Energy)
+            if ('Full Energy' in full_name):
+                link_df.at[count,'Monster'] = "Safi'jiiva (Full Energy)" #Only exception
+            else: #All other Monsters
+                link_df.at[count,'Monster'] = monster.get_text().split('(')[0] #Monster + space before parenthesis
+                link_df.at[count,'Monster'] = link_df.at[count,'Monster'][:-1] #Remove space
+            
+            #Star Rating
+            link_df.at[count,'Star Rating'] = category.find('h5').get_text()[0] #First character is the star rating
+            
+            #Link
+            link_df.at[count,'Link'] = main_url[:-1]+monster.find('a')['href'] #Main URL + link for each monster
+            count += 1
+
+    return link_df
+
+def gather_speedrun(main_url='https://mhwleaderboards.com/', output_file='speedrun_data.csv',
+                    max_workers=4, rate=0.5, burst=1, timeout=30, retries=3, backoff=1.0,
+                    cache_dir=None, resume=True, profiler=null_profiler, store=None):
+    """
+    Downloads every monster page linked from main_url and saves all speedrun data to output_file.
+    Pages are downloaded by up to 'max_workers' threads, at no more than 'rate' requests per second
+    per host (with bursts of 'burst' requests), and parsed as soon as each download finishes.
+    Each monster's rows are written as soon as they are parsed, in order. Downloads run at most 'max_workers'
+    monsters ahead of the next monster to write, so at most 'max_workers' pages are held in memory.
+    If the previous crawl was interrupted and 'resume' is True, monsters already written are skipped.
+    If 'cache_dir' is given, pages are cached there and only monsters whose page changed are parsed
+    again. Rows for unchanged monsters are taken from the cache.
+    Downloads (with the bytes of each page), parsing and writes are timed as stages of the profiler.
+    If a RunStore is given (see run_store.py), each monster's runs are also written to it.
+    """
+
+    cache = PageCache(cache_dir) if cache_dir is not None else None
+
+    #Instantiate table parser object, sharing one session and rate limiter between all downloads
+    table_parser = IBSpeedrunTableParser(session=make_session(max_workers, retries, backoff),
+                                         rate_limiter=HostRateLimiter(rate, burst),
+                                         timeout=timeout,
+                                         cache=cache)
+
+    with profiler.stage('fetch_main') as record:
+        main_page = table_parser.fetch_page(main_url)
+        record['bytes'] = len(main_page)
+
+    with profiler.stage('parse_links') as record:
+        link_df = parse_monster_links(main_page, main_url)
+        record['rows'] = len(link_df)
+
+    if cache is not None:
+        cache.commit(main_url)
+
+    def fetch(position):
+        #Runs in the download threads
+        with profiler.stage('fetch', monster=link_df['Monster'].iat[position]) as record:
+            content, changed = table_parser.fetch_if_changed(link_df['Link'].iat[position])
+            record['bytes'] = len(content)
+            record['changed'] = changed
+
+        return (content, changed)
+
+    writer = StreamingCsvWriter(output_file, link_df['Monster'], resume=resume)
+
+    #Position of the first monster still to gather
+    next_submit = len(writer.written())
+    if next_submit > 0:
+        print(f"Resuming after {next_submit} monsters already gathered...")
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {}
+        while True:
+            #Download at most max_workers monsters ahead of the next one to write, so a slow page
+            #can't make every later page wait in memory
+            while next_submit < len(link_df) and next_submit < writer.next_position + max_workers:
+                futures[executor.submit(fetch, next_submit)] = next_submit
+                next_submit += 1
+
+            if not futures:
+                break
+
+            #Parse pages while the remaining downloads are still in flight
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                #Drop the future so the downloaded page can be freed once it is parsed
+                position = futures.pop(future)
+                content, changed = future.result()
+                url = link_df['Link'].iat[position]
+                monster = link_df['Monster'].iat[position]
+
+                #Unchanged page: keep the rows gathered previously
+                mon_df = None
+                if cache is not None and not changed:
+                    with profiler.stage('load_rows', monster=monster) as record:
+                        mon_df = cache.load_rows(url)
+                        record['rows'] = len(mon_df) if mon_df is not None else 0
+
+                if mon_df is None:
+                    #Print statemant for how it's going
+                    print(f"Gathering speedrun data for {monster}...")
+
+                    #Get Dataframe for the monster
+                    with profiler.stage('parse', monster=monster) as record:
+                        mon_df = table_parser.parse_page(content)
+                        record['rows'] = len(mon_df)
+
+                    #Add columns for Monster and star rating
+                    mon_df.insert(0, 'Monster', monster)
+                    mon_df.insert(0, 'Star Rating', link_df['Star Rating'].iat[position])
+
+                    if cache is not None:
+                        cache.store_rows(url, mon_df)
+
+                #Save to the csv file
+                with profiler.stage('write', monster=monster) as record:
+                    writer.add(position, mon_df)
+                    record['rows'] = len(mon_df)
+
+                if store is not None:
+                    with profiler.stage('store', monster=monster) as record:
+                        store.write_runs(mon_df)
+                        record['rows'] = len(mon_df)
+
+    except BaseException:
+        #Fail right away: cancel the queued downloads instead of waiting for all of them
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+
+    else:
+        executor.shutdown()
 
-#Create one Dataframe to store all speedrun data
-speed_df = pd.DataFrame(columns=['Star Rating','Monster','Quest','Runner','Time','Weapon','Platform','Ruleset'])
+    finally:
+        if cache is not None:
+            cache.save()
 
-#Instantiate table parser object
-table_parser = IBSpeedrunTableParser()
+    with profiler.stage('close'):
+        writer.close()
+        if store is not None:
+            store.analyze()
 
-#Get Dataframes for each monster and append those to speed_df
-for index in link_df.index:
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Gather speedrun data from https://mhwleaderboards.com/')
+    arg_parser.add_argument('--url', default='https://mhwleaderboards.com/', help='main page of the leaderboards')
+    arg_parser.add_argument('--output', default='speedrun_data.csv', help='csv file to save the speedrun data')
+    arg_parser.add_argument('--workers', type=int, default=4, help='maximum number of concurrent downloads')
+    arg_parser.add_argument('--rate', type=float, default=0.5, help='maximum requests per second per host')
+    arg_parser.add_argument('--burst', type=int, default=1, help='maximum burst of requests per host')
+    arg_parser.add_argument('--timeout', type=float, default=30, help='timeout for each page, in seconds')
+    arg_parser.add_argument('--retries', type=int, default=3, help='retries for each failed page')
+    arg_parser.add_argument('--backoff', type=float, default=1.0, help='backoff factor between retries, in seconds')
+    arg_parser.add_argument('--cache-dir', default='.page_cache', help='directory to cache downloaded pages')
+    arg_parser.add_argument('--no-cache', action='store_true', help='download and parse every page again')
+    arg_parser.add_argument('--restart', action='store_true', help='ignore an interrupted crawl and start over')
+    arg_parser.add_argument('--db', default=None, help='sqlite file to also store the runs in (see run_store.py)')
+    arg_parser.add_argument('--profile', default=None, help='json file for the stage timings (also prints a summary)')
+    arg_parser.add_argument('--cprofile', action='store_true', help='include a cProfile of the main thread in the profile')
+    arg_parser.add_argument('--tracemalloc', action='store_true', help='record the peak memory of each stage')
+    args = arg_parser.parse_args()
 
-    #Print statemant for how it's going
-    print(f"Gathering speedrun data for {link_df['Monster'][index]}...")
-    url = link_df['Link'][index]
+    profiler = Profiler(enabled=args.profile is not None, cprofile=args.cprofile, memory=args.tracemalloc)
 
-    #Get Dataframe for the monster
-    mon_df = table_parser.parse_url(url)
+    store = None
+    if args.db is not None:
+        from run_store import RunStore
+        store = RunStore(args.db)
 
-    #Add columns for Monster and star rating
-    mon_df.insert(0, 'Monster', link_df['Monster'][index])
-    mon_df.insert(0, 'Star Rating', link_df['Star Rating'][index])
+    profiler.start()
 
-    #Append to speed_df
-    speed_df = speed_df.append(mon_df)
+    gather_speedrun(main_url=args.url, output_file=args.output, max_workers=args.workers,
+                    rate=args.rate, burst=args.burst, timeout=args.timeout,
+                    retries=args.retries, backoff=args.backoff,
+                    cache_dir=None if args.no_cache else args.cache_dir,
+                    resume=not args.restart, profiler=profiler, store=store)
 
-    #Wait to not overload server
-    time.sleep(30)
+    profiler.stop()
 
-#Save to a csv file
-speed_df.to_csv('speedrun_data.csv',index=False)
\ No newline at end of file
+    if args.profile is not None:
+        profiler.save(args.profile)
+        print(profiler.table())
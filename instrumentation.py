@@ -0,0 +1,178 @@
+import io
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from collections import OrderedDict
+
+class Profiler:
+    """
+    Stage-level instrumentation for gather_speedrun and make_rankings.
+    Every stage records its wall time, and optionally rows, bytes or other details set by the caller:
+        with profiler.stage('parse', monster='Alatreon') as record:
+            mon_df = table_parser.parse_page(content)
+            record['rows'] = len(mon_df)
+    Stages opened inside another stage (in the same thread) are named 'outer.inner'.
+    Stages may run in several threads at once.
+
+    With 'cprofile', the calling thread is profiled between start() and stop(), and with 'memory',
+    tracemalloc records the peak memory of each stage (peaks of stages running at the same time overlap).
+    A Profiler with enabled=False records nothing, so functions can always take one.
+    """
+
+    def __init__(self, enabled=True, cprofile=False, memory=False):
+        self.enabled = enabled
+        self.cprofile = cprofile and enabled
+        self.memory = memory and enabled
+        self.records = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.profile = None
+        self.started = time.perf_counter()
+        self.total_time = None
+
+    def start(self):
+        """
+        Starts the run, and cProfile and tracemalloc if wanted
+        """
+        self.started = time.perf_counter()
+
+        if self.memory:
+            tracemalloc.start()
+
+        if self.cprofile:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def stop(self):
+        """
+        Stops the run, and cProfile and tracemalloc if they were started
+        """
+        if self.profile is not None:
+            self.profile.disable()
+
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        self.total_time = time.perf_counter() - self.started
+
+    @contextmanager
+    def stage(self, name, **details):
+        """
+        Times the code in the with block as stage 'name'. Yields the record of the stage,
+        where the caller can set 'rows', 'bytes' or any other detail.
+        """
+        if not self.enabled:
+            yield {}
+            return
+
+        #Open stages of this thread: [name, highest peak memory seen before its last reset]
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+
+        record = OrderedDict(stage='.'.join([entry[0] for entry in stack] + [name]))
+        record.update(details)
+
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            #Keep the peak of the enclosing stage before resetting it for this one
+            if stack:
+                stack[-1][1] = max(stack[-1][1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        stack.append([name, 0])
+
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['start'] = round(start - self.started, 6)
+            record['time'] = round(time.perf_counter() - start, 6)
+            peak = stack.pop()[1]
+            if tracing and tracemalloc.is_tracing():
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                record['peak_mb'] = round(peak/2**20, 3)
+                if stack:
+                    stack[-1][1] = max(stack[-1][1], peak)
+
+            with self.lock:
+                self.records.append(record)
+
+    def summary(self):
+        """
+        Records grouped by stage, in order of first appearance: calls, total and mean time,
+        and the total rows and bytes and the highest peak memory, where recorded
+        """
+        stages = OrderedDict()
+
+        for record in sorted(self.records, key=lambda record: record['start']):
+            stage = stages.setdefault(record['stage'], OrderedDict(calls=0, time=0.0))
+            stage['calls'] += 1
+            stage['time'] += record['time']
+            for key in ['rows', 'bytes']:
+                if record.get(key) is not None:
+                    stage[key] = stage.get(key, 0) + record[key]
+            if 'peak_mb' in record:
+                stage['peak_mb'] = max(stage.get('peak_mb', 0), record['peak_mb'])
+
+        for stage in stages.values():
+            stage['time'] = round(stage['time'], 6)
+            stage['mean_time'] = round(stage['time']/stage['calls'], 6)
+
+        return stages
+
+    def top_functions(self, n=30):
+        """
+        The n functions with the highest cumulative time in the cProfile run
+        """
+        if self.profile is None:
+            return []
+
+        stats = pstats.Stats(self.profile, stream=io.StringIO())
+        functions = []
+        for (file_name, line, function), (calls, primitive_calls, tottime, cumtime, callers) in stats.stats.items():
+            functions.append(OrderedDict(function=f'{file_name}:{line}({function})', calls=calls,
+                                         tottime=round(tottime, 6), cumtime=round(cumtime, 6)))
+
+        return sorted(functions, key=lambda function: function['cumtime'], reverse=True)[:n]
+
+    def report(self):
+        """
+        Everything recorded, as a dict that can be saved as json
+        """
+        return OrderedDict(total_time=self.total_time,
+                           stages=self.summary(),
+                           records=sorted(self.records, key=lambda record: record['start']),
+                           cprofile=self.top_functions())
+
+    def save(self, json_file):
+        """
+        Saves the report to a json file
+        """
+        with open(json_file, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def table(self):
+        """
+        The summary as a printable table
+        """
+        lines = [f"{'Stage':40} {'Calls':>6} {'Time (s)':>9} {'Mean (s)':>9} {'Rows':>10} {'MB read':>8} {'Peak (MB)':>10}"]
+
+        for name, stage in self.summary().items():
+            rows = stage.get('rows', '')
+            size = f"{stage['bytes']/2**20:.2f}" if 'bytes' in stage else ''
+            peak = f"{stage['peak_mb']:.1f}" if 'peak_mb' in stage else ''
+            lines.append(f"{name:40} {stage['calls']:>6} {stage['time']:>9.3f} {stage['mean_time']:>9.4f} "
+                         f"{rows:>10} {size:>8} {peak:>10}")
+
+        if self.total_time is not None:
+            lines.append(f"{'total':40} {'':>6} {self.total_time:>9.3f}")
+
+        return '\n'.join(lines)
+
+#Profiler that records nothing, the default for instrumented functions
+null_profiler = Profiler(enabled=False)
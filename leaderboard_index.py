@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+
+from make_rankings import rank_groups
+
+def check_top_pos(top_pos):
+    """
+    Raises if top_pos doesn't select at least one run
+    """
+    if top_pos < 1:
+        raise Exception(f"top_pos must be at least 1, got {top_pos}")
+
+class LeaderboardIndex:
+    """
+    Precomputed index of ranked runs, built once from the output of make_rankings.
+    For every ruleset and rank column (see rank_groups) it keeps the times of each group sorted
+    by rank, with prefix sums, so top N queries never touch the DataFrames:
+        top_average, best_time, rank_of_time --> constant or logarithmic time
+        runner_rank                          --> hash lookup
+        average_top                          --> one lookup per weapon, same as average_top_runs
+    Usage:
+        index = LeaderboardIndex({'Freestyle':freestyle,'TA':ta})
+        index.top_average('TA','Monster','Alatreon',weapon='HBG',top_pos=3)
+    """
+
+    def __init__(self, rankings, weapon_column='Weapon', runner_column='Runner', time_column='Time (s)'):
+        self.weapon_column = weapon_column
+        self.time_column = time_column
+
+        #All of these are keyed by (ruleset, rank column)
+        self.groups = {}        #Group key --> (start, end) of its times
+        self.times = {}         #Times sorted by group, then rank
+        self.prefix = {}        #Prefix sums of times, starting at 0
+        self.runner_ranks = {}  #Best rank of each runner, indexed by group columns + runner
+        self.weapon_curves = {} #Weapons, and sum and count of their times for every top N
+
+        for ruleset, speed_df in rankings.items():
+            for rank_column, group_columns in rank_groups.items():
+                key = (ruleset, rank_column)
+
+                #Runs of each group are contiguous and in rank order
+                ordered = speed_df.sort_values(group_columns + [rank_column])
+                times = ordered[time_column].to_numpy(dtype=np.float64)
+
+                sizes = ordered.groupby(group_columns, observed=True, sort=False).size()
+                ends = np.cumsum(sizes.to_numpy())
+                group_keys = [group if isinstance(group, tuple) else (group,) for group in sizes.index]
+                self.groups[key] = dict(zip(group_keys, zip((ends - sizes.to_numpy()).tolist(), ends.tolist())))
+
+                self.times[key] = times
+                self.prefix[key] = np.concatenate([[0.0], np.cumsum(times)])
+
+                self.runner_ranks[key] = speed_df.groupby(group_columns + [runner_column],
+                                                          observed=True)[rank_column].min()
+
+                self.weapon_curves[key] = self.make_weapon_curves(speed_df, rank_column)
+
+    def make_weapon_curves(self, speed_df, rank_column):
+        """
+        For every weapon, the sum (in centiseconds) and count of the times of its runs with rank <= N,
+        for every N. Returns the weapons and two arrays of shape (n_weapons, max rank + 1).
+        """
+        weapon_codes, weapons = pd.factorize(speed_df[self.weapon_column], sort=True)
+        ranks = speed_df[rank_column].to_numpy(dtype=np.int64)
+        max_rank = ranks.max() if len(ranks) else 0
+
+        #Times are whole centiseconds, so sums are exact as integers
+        cents = np.rint(speed_df[self.time_column].to_numpy(dtype=np.float64)*100).astype(np.int64)
+
+        #Sum and count of times for each (weapon, rank), then accumulate over ranks
+        bins = weapon_codes*(max_rank + 1) + ranks
+        shape = (len(weapons), max_rank + 1)
+        sums = np.zeros(shape[0]*shape[1], dtype=np.int64)
+        np.add.at(sums, bins, cents)
+        sums = sums.reshape(shape)
+        counts = np.bincount(bins, minlength=shape[0]*shape[1]).reshape(shape)
+
+        return (np.asarray(weapons), np.cumsum(sums, axis=1), np.cumsum(counts, axis=1))
+
+    def group_slice(self, ruleset, filter_by, group, weapon=None):
+        """
+        Index key and (start, end) of the times of a quest or monster ('filter_by'),
+        for one weapon, or for all weapons together if weapon is None
+        """
+        rank_column = filter_by + ('/General' if weapon is None else '/Weapon')
+        group_key = (group,) if weapon is None else (group, weapon)
+        key = (ruleset, rank_column)
+
+        return (key, self.groups[key][group_key])
+
+    def top_average(self, ruleset, filter_by, group, weapon=None, top_pos=1):
+        """
+        Average of the 'top_pos' fastest times on a quest or monster ('filter_by'),
+        for one weapon or for all weapons if weapon is None. Constant time.
+        """
+        check_top_pos(top_pos)
+        key, (start, end) = self.group_slice(ruleset, filter_by, group, weapon)
+        n = min(top_pos, end - start)
+
+        return (self.prefix[key][start + n] - self.prefix[key][start])/n
+
+    def best_time(self, ruleset, filter_by, group, weapon=None):
+        """
+        Fastest time on a quest or monster ('filter_by'), for one weapon or for all weapons. Constant time.
+        """
+        key, (start, end) = self.group_slice(ruleset, filter_by, group, weapon)
+
+        return self.times[key][start]
+
+    def best_times(self, ruleset, filter_by, group):
+        """
+        Fastest time of each weapon on a quest or monster ('filter_by'), as a Series sorted by time
+        """
+        weapons = self.weapon_curves[(ruleset, filter_by + '/Weapon')][0]
+        groups = self.groups[(ruleset, filter_by + '/Weapon')]
+
+        best = {weapon: self.best_time(ruleset, filter_by, group, weapon)
+                for weapon in weapons if (group, weapon) in groups}
+
+        return pd.Series(best, name=self.time_column).sort_values()
+
+    def rank_of_time(self, ruleset, filter_by, group, time, weapon=None):
+        """
+        Rank a run with the given time would get on a quest or monster ('filter_by'),
+        for one weapon or for all weapons. Logarithmic time.
+        """
+        key, (start, end) = self.group_slice(ruleset, filter_by, group, weapon)
+
+        #Runs tied with an existing time rank after it
+        return int(np.searchsorted(self.times[key][start:end], time, side='right')) + 1
+
+    def runner_rank(self, ruleset, filter_by, group, runner, weapon=None):
+        """
+        Best rank of a runner on a quest or monster ('filter_by'), for one weapon or for all weapons
+        """
+        rank_column = filter_by + ('/General' if weapon is None else '/Weapon')
+        group_key = (group, runner) if weapon is None else (group, weapon, runner)
+
+        return int(self.runner_ranks[(ruleset, rank_column)].loc[group_key])
+
+    def average_top(self, ruleset, rank_column, top_pos=1):
+        """
+        Average of the times ranked 'top_pos' or better in 'rank_column', for each weapon class.
+        Same times as average_top_runs(speed_df, rank_column, top_pos=top_pos), ordered from fastest to slowest.
+        Averages are computed exactly, so one that falls on a half centisecond may round differently.
+        """
+        check_top_pos(top_pos)
+        weapons, sums, counts = self.weapon_curves[(ruleset, rank_column)]
+        n = min(top_pos, sums.shape[1] - 1)
+
+        #Weapons without any run ranked top_pos or better are left out
+        has_runs = counts[:, n] > 0
+
+        avg = pd.DataFrame({self.weapon_column: weapons[has_runs],
+                            self.time_column: sums[has_runs, n]/counts[has_runs, n]/100})
+
+        #Simplify time values, the same way as average_top_runs
+        avg[self.time_column] = avg[self.time_column].apply(lambda x: round(x,2))
+
+        #Sort weapons
+        avg = avg.sort_values(self.time_column, ascending=True).reset_index(drop=True)
+
+        #Update index to correspond to rankings (ie start at 1 rather than 0)
+        avg.index += 1
+
+        return avg
@@ -1,8 +1,9 @@
 import pandas as pd
 import numpy as np
 from string import ascii_uppercase
-import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
+
+from instrumentation import Profiler, null_profiler
 
 #Dictionary of weapon types
 weapon_dict = {'Great Sword':'GS',
@@ -23,184 +24,510 @@ weapon_dict = {'Great Sword':'GS',
 
 inv_weapon_dict = {value: key for key, value in weapon_dict.items()}
 
-#Prepare figure properties for later graphs
-figure_size = (16,7)
-font_size = 20
+#Rank columns and the columns grouping the runs for each of them
+rank_groups = {'Monster/General':['Monster'],
+               'Quest/General':['Quest'],
+               'Monster/Weapon':['Monster','Weapon'],
+               'Quest/Weapon':['Quest','Weapon']
+               }
+
+def rank_runs(speed_df,rank_groups=rank_groups,time_column='Time (s)',mask=None,profiler=null_profiler):
+    """
+    Ranks runs by time_column inside each group of runs, for every entry in rank_groups.
+    rank_groups maps the name of each rank column to the list of columns grouping the runs,
+    so ['Quest','Weapon'] ranks each weapon separately on each quest.
+    If a boolean mask is given, only the selected runs are ranked, without copying the rest of speed_df.
+    Returns a DataFrame with one rank column per entry (1 = fastest), aligned with the ranked runs.
+    Each rank column is timed as a stage of the profiler.
+    """
+
+    #Sort by time only once. The sort is stable, so tied times keep their original order
+    times = speed_df[time_column] if mask is None else speed_df.loc[mask,time_column]
+    order = times.sort_values(kind='stable').index
+
+    #Start with an empty dataframe
+    rank_df = pd.DataFrame(index=times.index)
 
-#Set style and context
-sns.set_context('notebook')
-sns.set_style('dark')
+    for rank_column, group_columns in rank_groups.items():
+        with profiler.stage(rank_column) as record:
+            #Rows are already sorted by time, so the rank is the position inside the group
+            ranking = speed_df.loc[order,group_columns].groupby(group_columns,sort=False,observed=True).cumcount() + 1
 
-def make_rankings(csv_file):
+            #Return to the original order of speed_df
+            rank_df[rank_column] = ranking.reindex(times.index)
+            record['rows'] = len(times)
+
+    return rank_df
+
+#Time strings, as MM'SS"CC. Runs of an hour or more may have more minute digits, or hours as H:MM'SS"CC
+#(minutes are then below 60). Seconds are always below 60.
+#Some runs on the leaderboards use ' or prime symbols instead of quotes, those are accepted too
+time_pattern = (r'^\s*(?:(?P<hours>\d+)[:h](?=[0-5]?\d[\'′’]))?(?P<minutes>\d+)[\'′’]'
+                r'(?P<seconds>[0-5]\d)["\'″′”](?P<cents>\d{2})\s*$')
+
+def to_seconds(time_series):
     """
-    Creates speedrun rankings from a csv file with data.
-    Use gather_speedrun.py to get data from https://mhwleaderboards.com/ in the proper format.
+    Converts a Series of time strings (see time_pattern) to seconds, all at once.
+    Malformed times become NaN.
     """
+    time_series = pd.Series(time_series)
+
+    #Many runs share the same time, so only parse each distinct time string once
+    codes, unique_times = pd.factorize(time_series)
+
+    parts = pd.Series(unique_times,dtype=object).astype(str).str.extract(time_pattern).astype(float)
+
+    #Hours are optional
+    hours = parts['hours'].fillna(0)
+
+    unique_seconds = (3600*hours + 60*parts['minutes'] + parts['seconds'] + parts['cents']/100).to_numpy()
+
+    #Missing times have code -1
+    seconds = np.where(codes >= 0, unique_seconds[codes], np.nan) if len(unique_seconds) else np.full(len(codes),np.nan)
+
+    return pd.Series(seconds,index=time_series.index)
+
+def to_time_string(seconds):
+    """
+    Converts seconds back to time strings (MM'SS"CC), all at once.
+    Minutes go past 59 for runs of an hour or more. NaN stays NaN.
+    """
+    seconds = pd.Series(seconds)
+    valid = seconds.notna()
+
+    #Work with whole centiseconds to avoid rounding errors
+    cents = (seconds[valid]*100).round().astype(np.int64)
+
+    time_strings = ((cents // 6000).astype(str).str.zfill(2) + "'"
+                    + (cents // 100 % 60).astype(str).str.zfill(2) + '"'
+                    + (cents % 100).astype(str).str.zfill(2))
+
+    return time_strings.reindex(seconds.index)
+
+#Columns with few distinct values, kept as categoricals through the ranking pipeline
+#and by the columnar storage backends
+category_columns = ['Star Rating','Monster','Quest','Runner','Weapon','Platform','Ruleset']
+
+#File extension for each storage backend
+storage_extensions = {'csv':'.csv','parquet':'.parquet','feather':'.feather'}
+
+def apply_schema(speed_df,time_column='Time (s)'):
+    """
+    Returns a copy of speed_df with compact types: categoricals for category_columns,
+    float32 times and the smallest unsigned integer type that fits each rank column.
+    """
+    speed_df = speed_df.copy()
+
+    for column in category_columns:
+        if column in speed_df.columns:
+            speed_df[column] = speed_df[column].astype('category')
+
+    speed_df[time_column] = speed_df[time_column].astype(np.float32)
+
+    for column in rank_groups:
+        if column in speed_df.columns:
+            speed_df[column] = pd.to_numeric(speed_df[column],downcast='unsigned')
+
+    return speed_df
+
+def save_rankings(speed_df,name,storage='csv'):
+    """
+    Saves a ranked dataframe as 'name' plus the extension of the storage backend.
+    storage can be 'csv', 'parquet' (smallest files) or 'feather' (uncompressed, can be memory-mapped).
+    The columnar backends need pyarrow and store the typed schema given by apply_schema.
+    """
+    file_name = name + storage_extensions[storage]
+
+    if storage == 'csv':
+        speed_df.to_csv(file_name,index=False)
+
+    elif storage == 'parquet':
+        apply_schema(speed_df).to_parquet(file_name,index=False)
+
+    elif storage == 'feather':
+        #Uncompressed, so the file can be memory-mapped when loading
+        apply_schema(speed_df).reset_index(drop=True).to_feather(file_name,compression='uncompressed')
+
+    return file_name
+
+def load_rankings(name,storage='csv',memory_map=True,time_column='Time (s)'):
+    """
+    Loads a ranked dataframe saved by save_rankings.
+    Feather files are memory-mapped if memory_map is True, so numeric and categorical columns
+    are used straight from the page cache instead of being decoded into new buffers.
+    Times stored as float32 by the columnar backends are loaded back as the same float64 values
+    make_rankings computes, so they can be compared with new times.
+    """
+    file_name = name + storage_extensions[storage]
+
+    if storage == 'csv':
+        return pd.read_csv(file_name)
+
+    elif storage == 'parquet':
+        speed_df = pd.read_parquet(file_name,memory_map=memory_map)
+
+    elif storage == 'feather':
+        import pyarrow.feather as feather
+        #split_blocks keeps columns apart, so they don't have to be copied into 2D blocks
+        speed_df = feather.read_table(file_name,memory_map=memory_map).to_pandas(split_blocks=True)
+
+    #Times are whole centiseconds, float32 keeps them to well under half a centisecond
+    speed_df[time_column] = speed_df[time_column].astype(np.float64).round(2)
+
+    return speed_df
+
+def as_categories(speed_df):
+    """
+    Returns speed_df with every column of category_columns as a categorical of strings, with sorted categories.
+    Categorical columns are stored as integer codes, and Star Rating is kept as strings (discrete values!).
+    Categories are sorted, so sorting by codes is sorting by value. read_csv only sorts them for small files.
+    """
+    for column in category_columns:
+        if column not in speed_df.columns:
+            continue
+        if not isinstance(speed_df[column].dtype,pd.CategoricalDtype):
+            speed_df = speed_df.assign(**{column:speed_df[column].astype(str).astype('category')})
+        elif not speed_df[column].cat.categories.is_monotonic_increasing:
+            categories = speed_df[column].cat.categories.sort_values()
+            speed_df = speed_df.assign(**{column:speed_df[column].cat.reorder_categories(categories)})
+
+    return speed_df
+
+def prepare_runs(speed_df,profiler=null_profiler):
+    """
+    Prepares runs in the format of speedrun_data.csv for ranking: drops repeat runs, adds the
+    Time (s) column, uses short weapon names and sorts runs for display (see sort_runs).
+    """
+
+    with profiler.stage('categories'):
+        speed_df = as_categories(speed_df)
 
-    #Import data as a dataframe
-    try:
-        freestyle = pd.read_csv(csv_file)
-    except:
-        print("Speedrun data not found! Try running gather_speerdrun.py first!")
-        
     # Filter out 'repeat runs'
     # 'Repeat run': run on the same monster, same quest, by the same runner with the same weapon, but different times.
     # Keep only the fastest run
-    freestyle = freestyle.drop_duplicates(['Monster','Quest','Runner','Weapon'],keep='first') #Already sorted by time,
-                                                                                                #first time = fastest!
-
-
-    #Function to convert the time field to seconds
-    def to_seconds(time_string):
-        
-        #Get minutes, seconds and centi seconds from string
-        minutes = int(time_string[0:2])
-        seconds = int(time_string[3:5])
-        cents = int(time_string[6:])
-        
-        #Return total in seconds
-        return 60*minutes+seconds+cents/100
-        
+    with profiler.stage('dedup') as record:
+        freestyle = speed_df.drop_duplicates(['Monster','Quest','Runner','Weapon'],keep='first') #Already sorted by time,
+                                                                                                    #first time = fastest!
+        record['rows'] = len(speed_df)
+        record['kept'] = len(freestyle)
+
     #Add Time (s) column (ie time in seconds)
-    freestyle.insert(5, 'Time (s)', freestyle['Time'].apply(to_seconds))
+    with profiler.stage('parse_times') as record:
+        time_seconds = to_seconds(freestyle['Time'])
+        record['rows'] = len(freestyle)
+
+    #Runs with malformed times can't be ranked, report and skip them
+    malformed = time_seconds.isna()
+    if malformed.any():
+        print(f"Skipping {malformed.sum()} runs with malformed times:")
+        print(freestyle.loc[malformed,['Monster','Quest','Runner','Time']].to_string())
+        freestyle = freestyle[~malformed]
+        time_seconds = time_seconds[~malformed]
 
-    #Convert Star Rating to string (discrete values!)
-    freestyle['Star Rating']=freestyle['Star Rating'].apply(str)
+    freestyle.insert(5, 'Time (s)', time_seconds)
 
-    #Apply dict to weapons column to have short names
-    freestyle['Weapon']=freestyle['Weapon'].apply(lambda x: weapon_dict[x])
+    #Apply dict to weapons categories to have short names
+    freestyle['Weapon']=freestyle['Weapon'].cat.rename_categories(weapon_dict)
 
-    # Sort dataframe by, in order: Star Rating, Monster, Quest, and Time
-    freestyle = freestyle.sort_values(['Star Rating','Monster','Time (s)','Quest'],ascending=[False,True,True,True])
+    with profiler.stage('sort') as record:
+        record['rows'] = len(freestyle)
+        return sort_runs(freestyle)
+
+def sort_runs(speed_df):
+    """
+    Sorts runs by, in order: Star Rating (descending), Monster, Time and Quest, with a fresh index
+    """
+    speed_df = speed_df.sort_values(['Star Rating','Monster','Time (s)','Quest'],ascending=[False,True,True,True])
 
     #Fix indexes
-    freestyle = freestyle.reset_index(drop=True)
-
-
-    # Function to generate rankings by quest or monster
-    def general_rank(speed_df,rank_by_column='Quest',time_column='Time (s)',sort=True):
-        
-
-        # Sort dataframe accordingly
-        if sort:
-            speed_df = speed_df.sort_values([rank_by_column,time_column],ascending=True)
-        
-        #Start with an empty list
-        ranking=[]
-        
-        #Get a list of all items to iterate through
-        rank_by_list = speed_df[rank_by_column].unique()
-        
-        #Iterate through all quests or monsters
-        for item in rank_by_list: 
-            #First entry is always rank 1
-            rank = 1; 
-
-            #Get slice of the input df corresponding to the quest name
-            df_slice = speed_df[speed_df[rank_by_column]==item]
-
-            #Append rankings to the list, for the length of the slice
-            for index, row in df_slice.iterrows():
-                ranking.append(rank)
-                rank += 1
-
-            #Reset rank count for next iteration
-            rank=1
-        
-        #Create DataFrame to return
-        rank_df = pd.DataFrame(data=ranking,index=speed_df.index)
-        
-        #If sorted previously, return to old sorting before returning
-        if sort:
-            rank_df = rank_df.sort_index()
-
-        return rank_df
-
-
-    # Function to generate rankings by quest or monster, separating each weapon
-    def weapon_rank(speed_df,rank_by_column='Quest',weapon_column='Weapon',time_column='Time (s)',sort=True):
-        
-        #Sort dataframe accordingly
-        if sort:
-            speed_df = speed_df.sort_values([rank_by_column,weapon_column,time_column],ascending=[True,True,True])
-        
-        #Start with empty list
-        ranking=[] 
-        
-        #Get a list of all items to iterate through
-        rank_by_list = speed_df[rank_by_column].unique()
-        
-        #Iterate through all quests or monsters
-        for item in rank_by_list: 
-            
-            #Get slice of the input df corresponding to the quest name
-            df_slice = speed_df[speed_df[rank_by_column]==item]
-        
-            #Get list of weapons with an entry for this quest/monster
-            weapon_list = df_slice[weapon_column].unique()
-
-            #Iterate through all weapons
-            for weapon in weapon_list:
-                #First entry is always rank 1
-                rank = 1;     
-
-                #Get subslice of slice_df corresponding to this weapon
-                df_subslice = df_slice[df_slice[weapon_column]==weapon]
-
-                #Append rankings to the list, for the length of the slice
-                for subindex, subrow in df_subslice.iterrows():
-                    ranking.append(rank)
-                    rank += 1
-
-                #Reset rank count for next iteration
-                rank=1
-        
-        #Create DataFrame to return
-        rank_df = pd.DataFrame(data=ranking,index=speed_df.index)
-        
-        #If sorted previously, return to old sorting before returning
-        if sort:
-            rank_df = rank_df.sort_index()
-
-        return rank_df
+    return speed_df.reset_index(drop=True)
 
+def assemble_rankings(freestyle,freestyle_ranks,ta_ranks):
+    """
+    Adds the rank columns to the prepared freestyle runs, and builds the TA dataframe from the TA runs
+    and their ranks (ta_ranks is indexed by the TA runs in freestyle). Returns (freestyle, ta).
+    """
+    ta_columns = [column for column in freestyle.columns if column != 'Ruleset'] #Drop Ruleset column as it is redundant
 
-    # Separate TA runs. Note that Freestyle runs also encompass TA runs (ie a TA run is also a Freestyle run, but a Freestyle run
-    # not be a TA run)
-    ta = freestyle[freestyle['Ruleset']=='TA Rules'].copy()
-    ta = ta.drop('Ruleset',axis=1) #Drop Ruleset column as it is redundant
+    freestyle[list(rank_groups)] = freestyle_ranks
 
+    ta = pd.concat([freestyle.loc[ta_ranks.index,ta_columns],ta_ranks],axis=1).reset_index(drop=True)
 
+    return (freestyle,ta)
 
-    #Rank by monster
-    freestyle['Monster/General'] = general_rank(freestyle[['Monster','Time (s)']],rank_by_column='Monster')
-    ta['Monster/General'] = general_rank(ta[['Monster','Time (s)']],rank_by_column='Monster')
+def make_rankings(csv_file,storage='csv',profiler=null_profiler,store=None):
+    """
+    Creates speedrun rankings from a csv file with data.
+    Use gather_speedrun.py to get data from https://mhwleaderboards.com/ in the proper format.
+    Rankings are saved as freestyle and ta, using the given storage backend (see save_rankings).
+    Each step is timed as a stage of the profiler (see instrumentation.py).
+    If a RunStore is given (see run_store.py), rankings are also written to it.
+    """
 
-    #Rank by quest
-    freestyle['Quest/General'] = general_rank(freestyle[['Quest','Time (s)']],rank_by_column='Quest')
-    ta['Quest/General'] = general_rank(ta[['Quest','Time (s)']],rank_by_column='Quest')
+    #Import data as a dataframe. Categorical columns are stored as integer codes, and Star Rating
+    #is read as strings (discrete values!)
+    try:
+        with profiler.stage('read_csv') as record:
+            freestyle = pd.read_csv(csv_file,dtype={column:'category' for column in category_columns})
+            record['rows'] = len(freestyle)
+    except:
+        print("Speedrun data not found! Try running gather_speerdrun.py first!")
 
+    with profiler.stage('prepare'):
+        freestyle = prepare_runs(freestyle,profiler)
 
+    # Separate TA runs. Note that Freestyle runs also encompass TA runs (ie a TA run is also a Freestyle run, but a Freestyle run
+    # not be a TA run). TA runs are ranked through a mask, and only copied once to build the TA dataframe
+    is_ta = freestyle['Ruleset']=='TA Rules'
 
-    #Rank by monster and weapon type
-    freestyle['Monster/Weapon'] = weapon_rank(freestyle[['Monster','Weapon','Time (s)']],
-                                            rank_by_column='Monster',weapon_column='Weapon')
-    ta['Monster/Weapon'] = weapon_rank(ta[['Monster','Weapon','Time (s)']],
-                                            rank_by_column='Monster',weapon_column='Weapon')
+    #Rank by monster, quest, monster and weapon type, and quest and weapon type
+    with profiler.stage('rank_ta'):
+        ta_ranks = rank_runs(freestyle,mask=is_ta,profiler=profiler)
+    with profiler.stage('rank_freestyle'):
+        freestyle_ranks = rank_runs(freestyle,profiler=profiler)
 
-    #Rank by quest and weapon type
-    freestyle['Quest/Weapon'] = weapon_rank(freestyle[['Quest','Weapon','Time (s)']],
-                                            rank_by_column='Quest',weapon_column='Weapon')
-    ta['Quest/Weapon'] = weapon_rank(ta[['Quest','Weapon','Time (s)']],
-                                            rank_by_column='Quest',weapon_column='Weapon')
+    with profiler.stage('assemble'):
+        freestyle, ta = assemble_rankings(freestyle,freestyle_ranks,ta_ranks)
 
     #Save formatted dataframes
-    freestyle.to_csv('freestyle.csv',index=False)
-    ta.to_csv('ta.csv',index=False)
+    with profiler.stage('save_freestyle') as record:
+        save_rankings(freestyle,'freestyle',storage)
+        record['rows'] = len(freestyle)
+    with profiler.stage('save_ta') as record:
+        save_rankings(ta,'ta',storage)
+        record['rows'] = len(ta)
+
+    if store is not None:
+        with profiler.stage('store') as record:
+            store.write_rankings(freestyle,ta)
+            record['rows'] = len(freestyle) + len(ta)
 
     #Return the freestyle and TA dataframes
     return (freestyle,ta)
 
+#Columns identifying a run: a runner only keeps their fastest run for each of these
+run_key = ['Monster','Quest','Runner','Weapon']
+
+def union_categories(frames):
+    """
+    Returns the frames with the same categories in each categorical column, so they can be
+    concatenated or merged without falling back to object columns.
+    Only the category lists are merged, and columns that already have them are left as they are.
+    """
+    frames = list(frames)
+
+    for column in category_columns:
+        columns = [df[column] for df in frames if column in df.columns]
+        if not columns or not all(isinstance(values.dtype,pd.CategoricalDtype) for values in columns):
+            continue
+
+        #Frames without any value (eg an empty batch) don't add categories
+        categories = None
+        for values in columns:
+            if len(values.cat.categories) == 0:
+                continue
+            if categories is None:
+                categories = values.cat.categories
+            elif not values.cat.categories.equals(categories):
+                categories = categories.union(values.cat.categories)
+
+        if categories is None:
+            continue
+
+        frames = [df.assign(**{column:df[column].cat.set_categories(categories)})
+                  if column in df.columns and not df[column].cat.categories.equals(categories) else df
+                  for df in frames]
+
+    return frames
+
+def group_codes(speed_df,group_columns):
+    """
+    One integer per row, equal for the rows with the same values in the categorical group_columns
+    """
+    codes = np.zeros(len(speed_df),dtype=np.int64)
+    for column in group_columns:
+        values = speed_df[column].cat
+        #Missing values have code -1
+        codes = codes*(len(values.categories) + 1) + values.codes.to_numpy() + 1
+
+    return codes
+
+def sort_keys(speed_df,time_column='Time (s)'):
+    """
+    One integer per row, in the order of sort_runs: Star Rating (descending), Monster, Time and Quest,
+    with missing values last. Categories must be sorted (see as_categories), and the same in every
+    frame compared.
+    """
+    keys = np.zeros(len(speed_df),dtype=np.int64)
+
+    for column, descending in [('Star Rating',True),('Monster',False)]:
+        n = len(speed_df[column].cat.categories)
+        codes = speed_df[column].cat.codes.to_numpy().astype(np.int64)
+        codes = np.where(codes < 0, n, (n - 1 - codes) if descending else codes)
+        keys = keys*(n + 1) + codes
+
+    #Times are whole centiseconds
+    cents = np.rint(speed_df[time_column].to_numpy(dtype=np.float64)*100).astype(np.int64)
+    keys = keys*(cents.max(initial=0) + 1) + cents
+
+    n = len(speed_df['Quest'].cat.categories)
+    codes = speed_df['Quest'].cat.codes.to_numpy().astype(np.int64)
+
+    return keys*(n + 1) + np.where(codes < 0, n, codes)
+
+def insert_runs(speed_df,added_df):
+    """
+    Inserts the runs of added_df in speed_df, which is in the order of sort_runs, at their place in that order.
+    New runs go after existing runs with the same keys, as sort_runs would place them after a concat.
+    Finds the places by binary search, instead of sorting everything again.
+    """
+    combined = pd.concat([speed_df,added_df],ignore_index=True)
+    if len(added_df) == 0:
+        return combined
+
+    keys = sort_keys(combined)
+    kept_keys, added_keys = keys[:len(speed_df)], keys[len(speed_df):]
+
+    #Rankings not in order (eg sorted by hand): sort them all
+    if np.any(kept_keys[1:] < kept_keys[:-1]):
+        return sort_runs(combined)
+
+    added_order = np.argsort(added_keys,kind='stable')
+    positions = np.searchsorted(kept_keys,added_keys[added_order],side='right')
+    order = np.insert(np.arange(len(speed_df)),positions,len(speed_df) + added_order)
+
+    return combined.take(order).reset_index(drop=True)
+
+def rerank_groups(speed_df,changed_df):
+    """
+    Recomputes the rank columns of speed_df, only for the groups with runs in changed_df
+    (which has the same categories). Rank columns hold the ranks before the update (NaN for new runs).
+    Returns the updated speed_df, and a row for every (run, rank column) whose rank changed.
+    """
+    changes = []
+
+    for rank_column, group_columns in rank_groups.items():
+        #Runs in a group with a new or removed run
+        changed_groups = np.unique(group_codes(changed_df,group_columns))
+        affected = np.isin(group_codes(speed_df,group_columns),changed_groups)
+
+        old_ranks = speed_df[rank_column].to_numpy(dtype=np.float64)
+        ranks = old_ranks.copy()
+        ranks[affected] = rank_runs(speed_df,{rank_column:group_columns},mask=affected)[rank_column].to_numpy()
+        speed_df[rank_column] = ranks.astype(np.int64)
+
+        #Runs whose rank changed (or new runs)
+        changed = affected & (old_ranks != ranks)
+        change_df = speed_df.loc[changed,run_key].copy()
+        change_df['Rank'] = rank_column
+        change_df['Old Rank'] = old_ranks[changed]
+        change_df['New Rank'] = ranks[changed].astype(np.int64)
+        changes.append(change_df)
+
+    return (speed_df,pd.concat(changes,ignore_index=True))
+
+def apply_update(speed_df,removed,added_df):
+    """
+    Removes the runs selected by the boolean mask 'removed' from a ranked dataframe, adds the runs in
+    added_df, and re-ranks the groups that changed. Returns the updated dataframe and its rank changes.
+    """
+    speed_df, added_df = union_categories([speed_df,added_df])
+
+    changed_df = pd.concat([speed_df.loc[removed,run_key],added_df[run_key]],ignore_index=True)
+
+    if removed.any():
+        speed_df = speed_df[~removed]
+
+    #New runs go after existing runs, so they rank after existing runs with the same time
+    speed_df = insert_runs(speed_df,added_df)
+
+    return rerank_groups(speed_df,changed_df)
+
+def update_rankings(freestyle,ta,new_runs,storage=None):
+    """
+    Adds a batch of new runs (in the format of speedrun_data.csv) to the freestyle and ta rankings
+    made by make_rankings (or loaded with load_rankings), without rebuilding them:
+        - a new run only replaces a runner's run on the same monster, quest and weapon if it is faster
+        - only the quests and monsters (and weapons) with new runs are ranked again
+    Returns the updated (freestyle, ta) and a dataframe of rank changes, with a row for every run and
+    rank column whose rank changed (Old Rank is NaN for new runs).
+    If storage is given, the rankings are saved as in make_rankings.
+    """
+
+    #Nothing to add (eg a live feed with no new runs)
+    if len(new_runs) == 0:
+        changes = pd.DataFrame(columns=['Ruleset'] + run_key + ['Rank','Old Rank','New Rank'])
+
+        if storage is not None:
+            save_rankings(freestyle,'freestyle',storage)
+            save_rankings(ta,'ta',storage)
+
+        return (freestyle,ta,changes)
+
+    #Fastest run of each runner in the batch first, so repeat runs are dropped
+    new_runs = new_runs.iloc[np.argsort(to_seconds(new_runs['Time']).to_numpy(),kind='stable')]
+    new_runs = prepare_runs(new_runs)
+
+    #Same column types as new_runs, for rankings loaded from csv (plain strings, and int star ratings)
+    freestyle, ta = as_categories(freestyle), as_categories(ta)
+
+    freestyle, ta, new_runs = union_categories([freestyle,ta,new_runs])
+
+    #Existing run of the same runner, monster, quest and weapon, if any (only monsters of the batch can have one)
+    candidates = np.isin(freestyle['Monster'].cat.codes.to_numpy(),new_runs['Monster'].cat.codes.unique())
+    merged = new_runs[run_key + ['Time (s)']].merge(freestyle.loc[candidates,run_key + ['Time (s)']].reset_index(),
+                                                     on=run_key,how='left',suffixes=('',' (old)'))
+
+    #Keep only new runs faster than the existing run
+    faster = (merged['Time (s) (old)'].isna() | (merged['Time (s)'] < merged['Time (s) (old)'])).to_numpy()
+    new_runs = new_runs[faster]
+
+    #Existing runs replaced by a faster run
+    replaced = freestyle.index.isin(merged.loc[faster,'index'].dropna())
+
+    ta_replaced = np.zeros(len(ta),dtype=bool)
+    if replaced.any():
+        replaced_keys = pd.MultiIndex.from_frame(freestyle.loc[replaced,run_key])
+        candidates = np.isin(ta['Monster'].cat.codes.to_numpy(),freestyle.loc[replaced,'Monster'].cat.codes.unique())
+        ta_replaced[candidates] = pd.MultiIndex.from_frame(ta.loc[candidates,run_key]).isin(replaced_keys)
+    new_ta = new_runs[new_runs['Ruleset']=='TA Rules'].drop('Ruleset',axis=1)
+
+    freestyle, freestyle_changes = apply_update(freestyle,replaced,new_runs)
+    ta, ta_changes = apply_update(ta,ta_replaced,new_ta)
+
+    freestyle_changes.insert(0,'Ruleset','Freestyle')
+    ta_changes.insert(0,'Ruleset','TA')
+    changes = pd.concat([freestyle_changes,ta_changes],ignore_index=True)
+
+    if storage is not None:
+        save_rankings(freestyle,'freestyle',storage)
+        save_rankings(ta,'ta',storage)
+
+    return (freestyle,ta,changes)
+
+def weapon_coverage_mask(speed_df,weapon_array=np.array([]),filter_by='Quest',weapon_column='Weapon'):
+    """
+    Returns a boolean mask of the runs whose group in the 'filter_by' column has runs with all the
+    weapon types in weapon_array (all weapon types in speed_df if weapon_array is empty).
+    Distinct weapons are counted for every group in a single groupby.
+    """
+
+    #Check for empty weapon_array
+    if not weapon_array.size:
+        #Get array of all weapon types
+        weapon_array = np.array(speed_df[weapon_column].unique())
+
+    #Only runs with one of the wanted weapons count towards coverage
+    wanted = speed_df[weapon_column].isin(weapon_array)
+
+    #Number of distinct wanted weapons in each group
+    weapon_count = speed_df[wanted].groupby(filter_by,observed=True)[weapon_column].nunique()
+
+    #Groups with every wanted weapon
+    full_groups = weapon_count.index[weapon_count == len(np.unique(weapon_array))]
+
+    return speed_df[filter_by].isin(full_groups)
+
 def filter_by_weapon(speed_df,weapon_array=np.array([]),filter_by='Quest',weapon_column='Weapon'):
     """
     Filters out runs that don't have all the weapon types given by weapon_list.
@@ -210,29 +537,12 @@ def filter_by_weapon(speed_df,weapon_array=np.array([]),filter_by='Quest',weapon
         weapon_array=np.array([]) --> if weapon_array is empty, leave only runs with ALL weapons
         weapon_columns            --> 'Weapon', name of column with weapon types
     """
-    
-    #Check for empty weapon_array
-    if not weapon_array.size: 
-    #Get array of all weapon types
-        weapon_array = np.sort(np.array(speed_df[weapon_column].unique())) #Sort to compare later
-    
-    #Get the array to filter by
-    filter_array = np.array(speed_df[filter_by].unique())
-
-    #Start with an empty dataframe
-    filter_df = pd.DataFrame() 
 
-    for item in filter_array:
+    mask = weapon_coverage_mask(speed_df,weapon_array,filter_by,weapon_column).to_numpy()
 
-        #Get a slice of speed_df corresponding to the current item
-        slice_df = speed_df[speed_df[filter_by] == item]
-
-        #Check if the slice has all weapon types
-        check = np.array_equal(weapon_array,np.sort(speed_df[speed_df[filter_by]==item][weapon_column].unique()))
-
-        #Concatenate to filter_df, if all weapons are present
-        if check:
-            filter_df = pd.concat([filter_df,slice_df])
+    #Keep runs of the same group together, with groups in order of first appearance
+    group_codes = pd.factorize(speed_df[filter_by])[0][mask]
+    filter_df = speed_df[mask].iloc[np.argsort(group_codes,kind='stable')]
 
     return filter_df.reset_index(drop=True)
 
@@ -249,7 +559,7 @@ def average_top_runs(speed_df,rank_column,weapon_column='Weapon',time_column='Ti
     avg = speed_df[speed_df[rank_column]<=top_pos]
 
     #Group by weapon type and get the mean values
-    avg = avg.groupby(weapon_column).mean().reset_index()
+    avg = avg.groupby(weapon_column,observed=True).mean(numeric_only=True).reset_index()
 
     #Simplify time values
     avg['Time (s)'] = avg['Time (s)'].apply(lambda x: round(x,2))
@@ -264,23 +574,28 @@ def average_top_runs(speed_df,rank_column,weapon_column='Weapon',time_column='Ti
     #Return
     return avg
 
-def make_tiers(rank_df,n_tiers=5,tier_list=[],weapon_column='Weapon (long)',time_column='Time (s)',sort=False):
+def tier_bounds(rank_df,n_tiers=5,time_column='Time (s)',group_by=None):
     """
-    Separates weapons from a ranking, given by 'rank_df' into tiers, sorted by the 'time_column'.
-    Weapons will be split into 'n_tiers' tiers. Weapon list is obtained from weapon_column.
+    Tier boundaries of a ranking, or of each group of runs in it (group_by is a list of columns).
+    The first tier is made so the fastest time sits in the middle of it, and tiers are made wide
+    enough for the times to fit in 'n_tiers' tiers (both rounded to whole seconds).
+    Returns a DataFrame with the start of the first tier, the width of the tiers and the number
+    of tiers needed to reach the slowest time, for each group in order of first appearance.
     """
+    if n_tiers < 2:
+        raise Exception("At least 2 tiers are needed")
 
-    #Sort rank_df by time_column if desired
-    if sort:
-        rank_df = rank_df.sort_values(time_column,ascending=True)
+    times = rank_df[time_column]
 
-    #If tier list is empty, create it from ascii_uppercase, with S as the first possible rank
-    if not tier_list:
-        tier_list = 'S'+ascii_uppercase
+    if group_by is None:
+        t_f = pd.Series([times.min()]) #Fastest time
+        t_s = pd.Series([times.max()]) #Slowest time
+    else:
+        grouped = times.groupby([rank_df[column] for column in group_by],sort=False,observed=True)
+        t_f = grouped.min()
+        t_s = grouped.max()
 
     #Time gap between fastest and slowest time
-    t_f = rank_df[time_column].min() #Fastest time
-    t_s = rank_df[time_column].max() #Slowest time
     time_gap = t_s - t_f
 
     #First tier will be made so the fastest time sits in the middle of it
@@ -289,123 +604,190 @@ def make_tiers(rank_df,n_tiers=5,tier_list=[],weapon_column='Weapon (long)',time
     #time_gap = (t_f - t_s)              (t_f -> slowest time, t_s -> fastest time)
     #tier_gap = time_gap/(n_tiers - 1)   (Gap between tiers is total time gap divided by n_tiers-1)
     #t_f = (t_0 + t_1) / 2               (Fastest time t_a sits between the first two tier times, t_0 and t_1)
-    time_list = [round(t_f - time_gap/(2*(n_tiers-1)),0)]
+    start = (t_f - time_gap/(2*(n_tiers-1))).round(0)
+
+    #And the time gap between each individual tier. Times less than a second apart would give
+    #tiers with no width, these get one second
+    tier_gap = (2*(t_f - start)).round(0).clip(lower=1)
+
+    #Tiers until the slowest time: the first tier boundary at or after it
+    count = np.ceil((t_s - start)/tier_gap).clip(lower=0)
+    count -= (count > 0) & (start + (count - 1)*tier_gap >= t_s)
+    count += start + count*tier_gap < t_s
+
+    return pd.DataFrame({'Start':start,'Tier Gap':tier_gap,'Tiers':count.astype(np.int64)})
+
+def tier_codes(rank_df,n_tiers=5,time_column='Time (s)',group_by=None,bounds=None):
+    """
+    Tier of each row of rank_df (0 = fastest tier), with tiers made for the whole ranking or for each
+    group of runs (group_by is a column or list of columns, eg 'Monster'), see tier_bounds.
+    Tiers are evenly spaced, so each row's tier comes from a single division by the tier width.
+    Returns an array of tier codes, -1 for rows outside all tiers.
+    """
+    group_by = [group_by] if isinstance(group_by,str) else group_by
 
-    #And the time gap between each individual tier
-    tier_gap = round(2*(t_f-time_list[0]),0)
+    if bounds is None:
+        bounds = tier_bounds(rank_df,n_tiers,time_column,group_by)
 
-    #Create rest of time tiers
-    while (time_list[-1] < rank_df[time_column].max()):
-        time_list.append(time_list[-1] + tier_gap)
+    #Group of each row (-1 for rows with missing values in group_by)
+    if group_by is None:
+        groups = np.zeros(len(rank_df),dtype=np.int64)
+    else:
+        groups = rank_df.groupby(group_by,sort=False,observed=True).ngroup().to_numpy()
 
-    #Tiers for the list:
-    tier_names = tier_list[:len(time_list)-1] #Single string
-    tier_names = ' '.join(tier_names) #With spaces
-    tier_names = tier_names.split() #List where each item is a tier name
+    start = bounds['Start'].to_numpy()[groups]
+    tier_gap = bounds['Tier Gap'].to_numpy()[groups]
+    count = bounds['Tiers'].to_numpy()[groups]
+    times = rank_df[time_column].to_numpy(dtype=np.float64)
+
+    #Tier boundaries are included in the slower tier, same as start <= time < end
+    with np.errstate(invalid='ignore'):
+        codes = np.floor((times - start)/tier_gap)
+        codes -= times < start + codes*tier_gap
+        codes += times >= start + (codes + 1)*tier_gap
+
+    outside = np.isnan(codes) | (codes < 0) | (codes >= count) | (groups < 0)
+
+    return np.where(outside,-1,np.nan_to_num(codes)).astype(np.int64)
+
+def make_tiers(rank_df,n_tiers=5,tier_list=[],weapon_column='Weapon (long)',time_column='Time (s)',sort=False,group_by=None):
+    """
+    Separates weapons from a ranking, given by 'rank_df' into tiers, sorted by the 'time_column'.
+    Weapons will be split into 'n_tiers' tiers. Weapon list is obtained from weapon_column.
+    If group_by is given (a column or list of columns, eg 'Monster'), each group is split into
+    tiers of its own, all in one pass.
+    Returns a DataFrame indexed by Tier (after the group_by columns) with the time interval and the
+    weapons of each tier. See style_tiers to display it.
+    """
+    group_by = [group_by] if isinstance(group_by,str) else group_by
+
+    #Sort rank_df by time_column if desired
+    if sort:
+        rank_df = rank_df.sort_values(time_column,ascending=True)
+
+    #If tier list is empty, create it from ascii_uppercase, with S as the first possible rank
+    if not tier_list:
+        tier_list = 'S'+ascii_uppercase
+    tier_names = np.array(' '.join(tier_list).split()) #Each item is a tier name
+
+    bounds = tier_bounds(rank_df,n_tiers,time_column,group_by)
+    codes = tier_codes(rank_df,n_tiers,time_column,group_by,bounds)
+
+    #One row per tier of each group, tiers without a name are left out
+    tiers = np.minimum(bounds['Tiers'].to_numpy(),len(tier_names))
+    groups = np.repeat(np.arange(len(bounds)),tiers)
+    tier = np.arange(len(groups)) - np.repeat(np.cumsum(tiers) - tiers,tiers)
 
     #Time intervals corresponding to each tier
-    time_intervals=[]
-    for i in range(0,len(tier_names)):
-        #Special cases for first and last cases
-        if (i==0):
-            time_intervals.append('Less than '+str(time_list[i+1])+' s')
-        
-        elif (i==len(tier_names)-1):
-            time_intervals.append('More than '+str(time_list[i])+' s')
-        
-        else: #Base case
-            time_intervals.append(str(time_list[i])+' s  -  '+str(time_list[i+1])+' s')
-
-    #Weapons in each rank
-    tier_weapons=[] #star with empty list
-
-    #Initialize a counter
-    counter=1
-
-    #Iterate through all tiers
-    for time in tier_names:
-
-        tier = tier_names[0]
-            
-        #Get the min and maximum allowed times for this tier
-        min_time = time_list[counter-1]
-        max_time = time_list[counter]
-
-        #Slice the valid portion of rank_df
-        slice_df = rank_df[(rank_df[time_column] >= min_time) & (rank_df[time_column] < max_time)]
-
-        #Append list of weapons to tier_weapons
-        tier_weapons.append(slice_df[weapon_column].tolist())
-        counter += 1
+    lower = pd.Series(bounds['Start'].to_numpy()[groups] + tier*bounds['Tier Gap'].to_numpy()[groups])
+    upper = lower + bounds['Tier Gap'].to_numpy()[groups]
+    time_intervals = np.where(tier == 0, 'Less than ' + upper.astype(str) + ' s',
+                     np.where(tier == tiers[groups] - 1, 'More than ' + lower.astype(str) + ' s',
+                              lower.astype(str) + ' s  -  ' + upper.astype(str) + ' s'))
+
+    #Weapons in each tier, in the order of rank_df
+    row_groups = np.zeros(len(rank_df),dtype=np.int64) if group_by is None else \
+                 rank_df.groupby(group_by,sort=False,observed=True).ngroup().to_numpy()
+    valid = (codes >= 0) & (codes < len(tier_names))
+    weapons = pd.Series(rank_df[weapon_column].astype(str).to_numpy()[valid]).groupby(
+                  [row_groups[valid],codes[valid]],sort=False).agg(', '.join)
+    tier_weapons = weapons.reindex(pd.MultiIndex.from_arrays([groups,tier]),fill_value='').to_numpy()
 
     #Make tier_df to return
-    tier_df = pd.DataFrame({'Tier':tier_names,'Average Times':time_intervals,'Weapons':tier_weapons})
+    tier_df = pd.DataFrame({'Tier':tier_names[tier],'Average Times':time_intervals,'Weapons':tier_weapons})
 
-    #Set tier column as index
-    tier_df = tier_df.set_index('Tier')
+    if group_by is None:
+        return tier_df.set_index('Tier')
 
-    #Convert lists in 'Weapons' column to strings for readability
-    tier_df['Weapons'] = tier_df['Weapons'].apply(lambda x: ', '.join(x))
+    #Group columns first
+    group_keys = bounds.index[groups].to_frame(index=False)
+    group_keys.columns = group_by
 
-    #Made 'Weapons' column longer for readability and return
+    return pd.concat([group_keys,tier_df],axis=1).set_index(group_by + ['Tier'])
+
+def style_tiers(tier_df):
+    """
+    Styler to display a tier list from make_tiers, with a longer 'Weapons' column for readability
+    """
     return tier_df.style.set_properties(subset=['Weapons'], **{'width': '400px'})
 
-def remove_outliers(speed_df,weapon_column='Weapon',time_column='Time (s)',quant1=0.25,quant3=0.75,mult=1.5):
+def outlier_mask(speed_df,group_columns='Weapon',time_column='Time (s)',quant1=0.25,quant3=0.75,mult=1.5):
     """
-    Removes entries with outlier times (defined by time_column), per weapon type
-    (defined by weapon_column)
+    Returns a boolean mask of the runs that are not outliers, with times (defined by time_column)
+    inside [Q1 - mult*IQR, Q3 + mult*IQR] for their group. group_columns is a column name or a list
+    of columns, eg ['Weapon','Monster'] to look for outliers per weapon on each monster.
+    The quantiles of all groups are computed in a single groupby.
     """
 
-    #First get a list of the different weapons available
-    weapon_list = speed_df[weapon_column].unique()
+    if isinstance(group_columns,str):
+        group_columns = [group_columns]
 
-    #Start with an empty dataframe
-    no_outliers = pd.DataFrame()
+    #Quantiles for each group
+    quantiles = speed_df.groupby(group_columns,observed=True)[time_column].quantile([quant1,quant3]).unstack()
 
-    #Iterate through weapon types
-    for weapon in weapon_list:
-        #Get a slice with just the current weapon
-        temp_df = speed_df[speed_df[weapon_column]==weapon]
+    #Broadcast the quantiles of each group back to its runs
+    if len(group_columns) > 1:
+        group_numbers = quantiles.index.get_indexer(pd.MultiIndex.from_frame(speed_df[group_columns]))
+    else:
+        group_numbers = quantiles.index.get_indexer(speed_df[group_columns[0]])
 
-        #Define quantiles
-        Q1 = temp_df[time_column].quantile(quant1)
-        Q3 = temp_df[time_column].quantile(quant3)
-        IQR = Q3 - Q1
+    Q1 = quantiles.to_numpy()[group_numbers,0]
+    Q3 = quantiles.to_numpy()[group_numbers,1]
+    IQR = Q3 - Q1
 
-        #The temp_df with no outliers
-        filter_mask = ((temp_df[time_column] >= Q1 - mult * IQR) & (temp_df[time_column] <= Q3 + mult *IQR))
-        temp_df = temp_df[filter_mask]
+    times = speed_df[time_column].to_numpy()
+    filter_mask = (times >= Q1 - mult * IQR) & (times <= Q3 + mult *IQR)
 
-        #Concatenate to output df
-        no_outliers=pd.concat([no_outliers,temp_df])
+    #Runs without a group (missing values) are dropped
+    filter_mask &= group_numbers >= 0
 
-    
-    #Return df with no outliers
-    return no_outliers
+    return pd.Series(filter_mask,index=speed_df.index)
 
-def show_top_runs(speed_df,filter_by='Quest',rank_type='Weapon',ruleset='TA'):
+def remove_outliers(speed_df,weapon_column='Weapon',time_column='Time (s)',quant1=0.25,quant3=0.75,mult=1.5):
     """
-    Creates a bar plot of the average clear times in speed_df. Times can be filtered by 'Quest' or 'Monster'.
-    Rank_type can be either by 'Weapon' (ie rank each weapon individually) or 'General' (group all weapons together)
+    Removes entries with outlier times (defined by time_column), per weapon type
+    (defined by weapon_column, which can also be a list of columns). See outlier_mask.
     """
 
-    #Change rank_type string so it coincides with column names on speed_df:
-    rank_type=filter_by+'/'+rank_type
-
-    #Filter out so we have only Quests or Monsters with at least one entry per weapon
-    output_df = filter_by_weapon(speed_df,filter_by=filter_by)
+    mask = outlier_mask(speed_df,weapon_column,time_column,quant1,quant3,mult).to_numpy()
 
-    #Get average times
-    output_df = average_top_runs(output_df,rank_type)
+    #Keep runs with the same weapon together, with weapons in order of first appearance
+    group_numbers = speed_df.groupby(weapon_column,observed=True,sort=False).ngroup().to_numpy()[mask]
+    no_outliers = speed_df[mask].iloc[np.argsort(group_numbers,kind='stable')]
 
-    plt.figure(figsize=figure_size)
-    sns.barplot(x='Weapon',y='Time (s)',data=output_df).set_title(f'Average TOP clear times - {filter_by} - {ruleset}', fontsize =font_size)
-
-    #Apply mapping from inv_weapon-dict
-    output_df['Weapon (long)']=output_df['Weapon'].apply(lambda x: inv_weapon_dict[x])
-    #Numerical values
-    print(f'\nAverage Top clear times - {rank_type} - {ruleset} ')
-    print(output_df[['Weapon (long)','Time (s)']])
+    #Return df with no outliers
+    return no_outliers
 
-    #Return output_df for use later
-    return output_df
\ No newline at end of file
+def show_top_runs(speed_df,filter_by='Quest',rank_type='Weapon',ruleset='TA'):
+    """
+    Creates a bar plot of the average clear times in speed_df, see plot_rankings.show_top_runs.
+    Plotting libraries are only imported when a chart is drawn.
+    """
+    from plot_rankings import show_top_runs
+
+    return show_top_runs(speed_df,filter_by,rank_type,ruleset)
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Make speedrun rankings from the gathered data')
+    arg_parser.add_argument('--data', default='speedrun_data.csv', help='csv file with the speedrun data')
+    arg_parser.add_argument('--storage', default='csv', choices=list(storage_extensions), help='storage for the rankings')
+    arg_parser.add_argument('--db', default=None, help='sqlite file to also store the rankings in (see run_store.py)')
+    arg_parser.add_argument('--profile', default=None, help='json file for the stage timings (also prints a summary)')
+    arg_parser.add_argument('--cprofile', action='store_true', help='include a cProfile of the run in the profile')
+    arg_parser.add_argument('--tracemalloc', action='store_true', help='record the peak memory of each stage')
+    args = arg_parser.parse_args()
+
+    profiler = Profiler(enabled=args.profile is not None, cprofile=args.cprofile, memory=args.tracemalloc)
+
+    store = None
+    if args.db is not None:
+        from run_store import RunStore
+        store = RunStore(args.db)
+
+    profiler.start()
+    make_rankings(args.data, storage=args.storage, profiler=profiler, store=store)
+    profiler.stop()
+
+    if args.profile is not None:
+        profiler.save(args.profile)
+        print(profiler.table())
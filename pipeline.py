@@ -0,0 +1,183 @@
+"""
+Batch pipeline: parse saved pages, rank and export, using several processes.
+
+Usage:
+    python pipeline.py [--cache-dir .page_cache] [--data speedrun_data.csv] [--workers N] [--skip-parse]
+
+Stages:
+    parse  --> monster pages saved in the page cache of gather_speedrun.py are parsed by a process pool.
+               Each worker writes its rows to a part file, so no DataFrames are sent between processes.
+    rank   --> every rank column of the freestyle and TA rankings is computed by its own worker.
+               Workers read the group codes and times from memory-mapped arrays and write the ranks
+               back to a memory-mapped output array.
+    export --> freestyle and ta are saved at the same time, by two threads.
+The output is the same as gather_speedrun.py followed by make_rankings. --workers 1 runs every stage serially.
+"""
+import os
+import time
+import argparse
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from gather_speedrun import IBSpeedrunTableParser, PageCache, parse_monster_links
+from make_rankings import (category_columns, rank_groups, rank_runs, prepare_runs,
+                           assemble_rankings, save_rankings)
+
+def run_tasks(func, tasks, workers):
+    """
+    Runs func on every task, in a process pool if workers > 1. Results keep the order of tasks.
+    """
+    if workers == 1:
+        return [func(task) for task in tasks]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, tasks))
+
+def parse_worker(task):
+    """
+    Parses one saved monster page and writes its rows, without header, to a part file.
+    Returns the column names and number of rows.
+    """
+    page_file, monster, star_rating, part_file = task
+
+    with open(page_file, 'rb') as f:
+        mon_df = IBSpeedrunTableParser().parse_page(f.read())
+
+    #Add columns for Monster and star rating
+    mon_df.insert(0, 'Monster', monster)
+    mon_df.insert(0, 'Star Rating', star_rating)
+
+    mon_df.to_csv(part_file, header=False, index=False)
+
+    return (list(mon_df.columns), len(mon_df))
+
+def parse_pages(cache_dir, main_url, output_file, workers, tmp_dir):
+    """
+    Parses every monster page linked from the cached main page, and writes all rows to output_file
+    in the order of the main page. Returns the number of rows.
+    """
+    cache = PageCache(cache_dir)
+    link_df = parse_monster_links(cache.load(main_url), main_url)
+
+    tasks = [(cache.page_file(link_df['Link'].iat[position]), link_df['Monster'].iat[position],
+              link_df['Star Rating'].iat[position], os.path.join(tmp_dir, f'part-{position}.csv'))
+             for position in range(len(link_df))]
+
+    results = run_tasks(parse_worker, tasks, workers)
+
+    #Header, then every part file in order
+    with open(output_file, 'w', encoding='utf-8', newline='') as output:
+        pd.DataFrame(columns=results[0][0]).to_csv(output, index=False)
+        for task in tasks:
+            with open(task[3], encoding='utf-8', newline='') as part:
+                output.write(part.read())
+
+    return sum(n_rows for columns, n_rows in results)
+
+def rank_worker(task):
+    """
+    Computes one rank column. Group codes, times and the ruleset mask are read from memory-mapped
+    arrays in 'array_dir', and the ranks are written to row 'output_row' of the memory-mapped output.
+    """
+    array_dir, output_name, output_row, rank_column, group_columns, mask_name = task
+
+    def load(name, mode='r'):
+        return np.load(os.path.join(array_dir, name + '.npy'), mmap_mode=mode)
+
+    speed_df = pd.DataFrame({column: load(column) for column in group_columns + ['Time (s)']}, copy=False)
+    mask = load(mask_name) if mask_name is not None else None
+
+    ranks = rank_runs(speed_df, {rank_column: group_columns}, mask=mask)[rank_column]
+
+    output = load(output_name, 'r+')
+    output[output_row, ranks.index.to_numpy()] = ranks.to_numpy()
+    output.flush()
+
+def rank_rulesets(freestyle, workers, tmp_dir):
+    """
+    Ranks the prepared freestyle runs, and the TA runs among them, with one task per ruleset and
+    rank column. Returns the freestyle and TA ranks, as make_rankings computes them.
+    """
+    n_runs = len(freestyle)
+    is_ta = (freestyle['Ruleset']=='TA Rules').to_numpy()
+
+    #Categorical columns are shared as their integer codes
+    group_columns = sorted({column for columns in rank_groups.values() for column in columns})
+    for column in group_columns:
+        values = freestyle[column].cat.codes if column in category_columns else freestyle[column]
+        np.save(os.path.join(tmp_dir, column + '.npy'), values.to_numpy())
+    np.save(os.path.join(tmp_dir, 'Time (s).npy'), freestyle['Time (s)'].to_numpy(dtype=np.float64))
+    np.save(os.path.join(tmp_dir, 'is_ta.npy'), is_ta)
+
+    #One row of ranks per rank column, for each ruleset
+    for name in ['freestyle_ranks', 'ta_ranks']:
+        np.lib.format.open_memmap(os.path.join(tmp_dir, name + '.npy'), mode='w+',
+                                  dtype=np.int64, shape=(len(rank_groups), n_runs)).flush()
+
+    tasks = [(tmp_dir, output_name, row, rank_column, group_columns, mask_name)
+             for output_name, mask_name in [('freestyle_ranks', None), ('ta_ranks', 'is_ta')]
+             for row, (rank_column, group_columns) in enumerate(rank_groups.items())]
+
+    run_tasks(rank_worker, tasks, workers)
+
+    freestyle_ranks = np.load(os.path.join(tmp_dir, 'freestyle_ranks.npy'))
+    ta_ranks = np.load(os.path.join(tmp_dir, 'ta_ranks.npy'))
+
+    freestyle_ranks = pd.DataFrame(freestyle_ranks.T, index=freestyle.index, columns=list(rank_groups))
+    ta_ranks = pd.DataFrame(ta_ranks[:, is_ta].T, index=freestyle.index[is_ta], columns=list(rank_groups))
+
+    return (freestyle_ranks, ta_ranks)
+
+def run_pipeline(cache_dir='.page_cache', main_url='https://mhwleaderboards.com/', data_file='speedrun_data.csv',
+                 storage='csv', workers=None, parse=True):
+    """
+    Runs the parse, rank and export stages with 'workers' processes (all cores if None).
+    If parse is False, the rankings are made from the existing data_file.
+    Returns (freestyle, ta) and the time taken by each stage, in seconds.
+    """
+    workers = workers or os.cpu_count()
+    stage_times = OrderedDict()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if parse:
+            start = time.perf_counter()
+            parse_pages(cache_dir, main_url, data_file, workers, tmp_dir)
+            stage_times['parse'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        freestyle = prepare_runs(pd.read_csv(data_file, dtype={column:'category' for column in category_columns}))
+        stage_times['prepare'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        freestyle_ranks, ta_ranks = rank_rulesets(freestyle, workers, tmp_dir)
+        freestyle, ta = assemble_rankings(freestyle, freestyle_ranks, ta_ranks)
+        stage_times['rank'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(lambda table: save_rankings(*table, storage), [(freestyle, 'freestyle'), (ta, 'ta')]))
+    stage_times['export'] = time.perf_counter() - start
+
+    return ((freestyle, ta), stage_times)
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Parse, rank and export speedrun data using several processes')
+    arg_parser.add_argument('--cache-dir', default='.page_cache', help='page cache of gather_speedrun.py')
+    arg_parser.add_argument('--url', default='https://mhwleaderboards.com/', help='main page of the leaderboards')
+    arg_parser.add_argument('--data', default='speedrun_data.csv', help='csv file with the speedrun data')
+    arg_parser.add_argument('--storage', default='csv', choices=['csv','parquet','feather'], help='storage for the rankings')
+    arg_parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    arg_parser.add_argument('--skip-parse', action='store_true', help='rank the existing speedrun data')
+    args = arg_parser.parse_args()
+
+    tables, stage_times = run_pipeline(cache_dir=args.cache_dir, main_url=args.url, data_file=args.data,
+                                       storage=args.storage, workers=args.workers, parse=not args.skip_parse)
+
+    print(f"{'Stage':10} {'Time (s)':>9}")
+    for stage, seconds in stage_times.items():
+        print(f'{stage:10} {seconds:>9.3f}')
+    print(f"{'total':10} {sum(stage_times.values()):>9.3f}")
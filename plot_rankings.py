@@ -0,0 +1,66 @@
+"""
+Plotting layer of the analysis. matplotlib and seaborn are only imported with this module,
+so the ranking functions in make_rankings.py load without them.
+"""
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from make_rankings import inv_weapon_dict, filter_by_weapon, average_top_runs
+
+#Prepare figure properties for later graphs
+figure_size = (16,7)
+font_size = 20
+
+#Whether the style was already set
+style_set = False
+
+def set_style():
+    """
+    Sets the style and context of the charts, once, before the first one is drawn
+    """
+    global style_set
+
+    if not style_set:
+        sns.set_context('notebook')
+        sns.set_style('dark')
+        style_set = True
+
+def plot_top_runs(output_df,title,ax=None):
+    """
+    Bar plot of the average times of each weapon in output_df (as returned by average_top_runs),
+    from fastest to slowest. Draws on ax if given, otherwise on a new figure. Returns the axes.
+    """
+    set_style()
+
+    if ax is None:
+        ax = plt.figure(figsize=figure_size).gca()
+
+    sns.barplot(x='Weapon',y='Time (s)',data=output_df,order=output_df['Weapon'],ax=ax).set_title(title,fontsize=font_size)
+
+    return ax
+
+def show_top_runs(speed_df,filter_by='Quest',rank_type='Weapon',ruleset='TA'):
+    """
+    Creates a bar plot of the average clear times in speed_df. Times can be filtered by 'Quest' or 'Monster'.
+    Rank_type can be either by 'Weapon' (ie rank each weapon individually) or 'General' (group all weapons together)
+    """
+
+    #Change rank_type string so it coincides with column names on speed_df:
+    rank_type=filter_by+'/'+rank_type
+
+    #Filter out so we have only Quests or Monsters with at least one entry per weapon
+    output_df = filter_by_weapon(speed_df,filter_by=filter_by)
+
+    #Get average times
+    output_df = average_top_runs(output_df,rank_type)
+
+    plot_top_runs(output_df,f'Average TOP clear times - {filter_by} - {ruleset}')
+
+    #Apply mapping from inv_weapon-dict
+    output_df['Weapon (long)']=output_df['Weapon'].apply(lambda x: inv_weapon_dict[x])
+    #Numerical values
+    print(f'\nAverage Top clear times - {rank_type} - {ruleset} ')
+    print(output_df[['Weapon (long)','Time (s)']])
+
+    #Return output_df for use later
+    return output_df
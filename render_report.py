@@ -0,0 +1,144 @@
+"""
+Headless report: renders every chart and table of the analysis to files, without Jupyter.
+
+Usage:
+    python render_report.py [--output report] [--top 1 3 5] [--formats png svg] [--workers N]
+                            [--storage csv] [--data speedrun_data.csv] [--tiers 7]
+
+For every combination of (Quest/Monster) x (General/Weapon) x (Freestyle/TA) x top N, writes:
+    charts/<ruleset>-<filter_by>-<rank_type>-top<N>.<format> --> bar plot of the average top times, as show_top_runs
+    tables/<ruleset>-<filter_by>-<rank_type>-top<N>.html     --> the average times, and their tier list (make_tiers)
+and an index.html with all of them. Rankings are loaded with load_rankings, or made from --data if missing.
+Averages are computed once in the main process. Charts and tables are rendered by a pool of processes,
+each drawing on a single reused figure with the non-interactive Agg backend.
+"""
+import os
+import argparse
+from itertools import product
+
+#Non-interactive backend, before pyplot is imported
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from pipeline import run_tasks
+from make_rankings import (inv_weapon_dict, storage_extensions, to_time_string, load_rankings,
+                           make_rankings, filter_by_weapon, average_top_runs, make_tiers, style_tiers)
+from plot_rankings import figure_size, plot_top_runs
+
+filter_options = ['Quest','Monster']
+rank_options = ['General','Weapon']
+
+#Figure of this process, reused for every chart
+figure = None
+
+def load_report_rankings(storage='csv', data_file='speedrun_data.csv'):
+    """
+    Returns {'Freestyle': freestyle, 'TA': ta}, loaded from saved rankings, or made from data_file if there are none
+    """
+    if all(os.path.exists(name + storage_extensions[storage]) for name in ['freestyle','ta']):
+        freestyle, ta = load_rankings('freestyle', storage), load_rankings('ta', storage)
+    else:
+        freestyle, ta = make_rankings(data_file, storage)
+
+    return {'Freestyle': freestyle, 'TA': ta}
+
+def report_tasks(rankings, top_list, formats, output_dir, n_tiers=7):
+    """
+    Computes the average top times for every combination, and returns one render task for each
+    """
+    tasks = []
+
+    for (ruleset, speed_df), filter_by in product(rankings.items(), filter_options):
+        #Only quests or monsters with at least one run per weapon, as in show_top_runs
+        filtered = filter_by_weapon(speed_df, filter_by=filter_by)
+
+        for rank_type, top_pos in product(rank_options, top_list):
+            rank_column = filter_by + '/' + rank_type
+            avg = average_top_runs(filtered, rank_column, top_pos=top_pos)[['Weapon','Time (s)']]
+
+            name = f'{ruleset}-{filter_by}-{rank_type}-top{top_pos}'.lower()
+            title = f'Average TOP {top_pos} clear times - {rank_column} - {ruleset}'
+
+            tasks.append((avg, name, title, formats, output_dir, n_tiers))
+
+    return tasks
+
+def render_task(task):
+    """
+    Draws the chart and writes the tables of one combination. Returns the names of the files written.
+    """
+    global figure
+    avg, name, title, formats, output_dir, n_tiers = task
+
+    if avg.empty:
+        return []
+
+    if figure is None:
+        figure = plt.figure(figsize=figure_size)
+
+    figure.clf()
+    plot_top_runs(avg, title, ax=figure.add_subplot())
+
+    files = []
+    for chart_format in formats:
+        files.append(os.path.join('charts', f'{name}.{chart_format}'))
+        figure.savefig(os.path.join(output_dir, files[-1]), format=chart_format, bbox_inches='tight')
+
+    #Averages, with long weapon names and readable times
+    table = avg.assign(**{'Weapon (long)': avg['Weapon'].map(inv_weapon_dict), 'Time': to_time_string(avg['Time (s)'])})
+    html = f'<h2>{title}</h2>\n' + table[['Weapon (long)','Time','Time (s)']].to_html()
+
+    #Tiers need at least two different times
+    if avg['Time (s)'].nunique() > 1:
+        html += '\n<h3>Tier list</h3>\n' + style_tiers(make_tiers(table, n_tiers=n_tiers)).to_html()
+
+    files.append(os.path.join('tables', f'{name}.html'))
+    with open(os.path.join(output_dir, files[-1]), 'w', encoding='utf-8') as f:
+        f.write(html)
+
+    return files
+
+def render_report(rankings, output_dir='report', top_list=(1,3,5), formats=('png',), workers=None, n_tiers=7):
+    """
+    Renders the charts and tables of every combination to output_dir, with 'workers' processes
+    (all cores if None), and writes an index.html linking them. Returns the files written.
+    """
+    workers = workers or os.cpu_count()
+
+    for directory in ['charts','tables']:
+        os.makedirs(os.path.join(output_dir, directory), exist_ok=True)
+
+    tasks = report_tasks(rankings, top_list, formats, output_dir, n_tiers)
+    results = run_tasks(render_task, tasks, workers)
+
+    #Index with every chart and table, in the order of the tasks
+    sections = []
+    for (avg, name, title, *rest), files in zip(tasks, results):
+        if not files:
+            sections.append(f'<h2>{title}</h2>\n<p>No quest or monster has runs with every weapon.</p>')
+            continue
+
+        charts = [f'<img src="{file_name}" alt="{title}">' for file_name in files if not file_name.endswith('.html')]
+        sections.append('\n'.join(charts[:1]) + f'\n<p><a href="{files[-1]}">{title} (table)</a></p>')
+
+    with open(os.path.join(output_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write('<html><body>\n<h1>Iceborne Speedrun Analysis</h1>\n' + '\n'.join(sections) + '\n</body></html>')
+
+    return [file_name for files in results for file_name in files] + ['index.html']
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Render every chart and table of the analysis to files')
+    arg_parser.add_argument('--output', default='report', help='output directory')
+    arg_parser.add_argument('--top', type=int, nargs='+', default=[1,3,5], help='top N runs to average')
+    arg_parser.add_argument('--formats', nargs='+', default=['png'], choices=['png','svg'], help='chart formats')
+    arg_parser.add_argument('--workers', type=int, default=None, help='render processes (default: all cores)')
+    arg_parser.add_argument('--storage', default='csv', choices=list(storage_extensions), help='storage of the rankings')
+    arg_parser.add_argument('--data', default='speedrun_data.csv', help='speedrun data, if there are no rankings yet')
+    arg_parser.add_argument('--tiers', type=int, default=7, help='number of tiers in the tier lists')
+    args = arg_parser.parse_args()
+
+    files = render_report(load_report_rankings(args.storage, args.data), output_dir=args.output, top_list=args.top,
+                          formats=args.formats, workers=args.workers, n_tiers=args.tiers)
+
+    print(f'{len(files)} files written to {args.output}')
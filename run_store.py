@@ -0,0 +1,193 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from make_rankings import category_columns, rank_groups, inv_weapon_dict
+
+#Columns that can be filtered in RunStore.query, by keyword
+filter_columns = {'star_rating':'Star Rating','monster':'Monster','quest':'Quest','runner':'Runner',
+                  'weapon':'Weapon','platform':'Platform','ruleset':'Ruleset'}
+
+class RunStore:
+    """
+    SQLite storage for the scraped runs and the rankings, with indexed queries.
+    Tables have the same columns as the DataFrames:
+        runs      --> runs as gathered by gather_speedrun (speedrun_data.csv)
+        freestyle --> freestyle rankings from make_rankings
+        ta        --> TA rankings from make_rankings
+        runner_stats --> statistics of every runner from runner_stats.RunnerStats
+    Every table is indexed on (Ruleset, Monster, Quest, Weapon, time) (without Ruleset for ta, which
+    only has TA runs) and on Runner, so queries on a monster, quest, weapon or runner only read
+    the matching rows:
+        store = RunStore('speedrun.db')
+        store.query('ta', monster='Alatreon', weapon='HBG')
+    Rows are inserted in batches of 'batch_size', each write in a single transaction.
+    """
+
+    #Index columns of each table
+    indexes = {'runs': {'groups':['Ruleset','Monster','Quest','Weapon','Time'], 'runner':['Runner']},
+               'freestyle': {'groups':['Ruleset','Monster','Quest','Weapon','Time (s)'], 'runner':['Runner']},
+               'ta': {'groups':['Monster','Quest','Weapon','Time (s)'], 'runner':['Runner']},
+               'runner_stats': {'runner':['Ruleset','Runner'], 'first_places':['Ruleset','First places']}}
+
+    def __init__(self, db_file='speedrun.db', batch_size=50000):
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(db_file)
+
+        #Faster writes, still safe after a crash of the program
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+    def close(self):
+        self.connection.close()
+
+    def tables(self):
+        """
+        Names of the tables in the store
+        """
+        rows = self.connection.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchall()
+        return [row[0] for row in rows]
+
+    def columns(self, table):
+        """
+        Column names of a table, in order
+        """
+        return [row[1] for row in self.connection.execute(f'PRAGMA table_info("{table}")').fetchall()]
+
+    def create_table(self, table, speed_df):
+        """
+        Creates 'table' with the columns of speed_df, if it doesn't exist, and its indexes
+        """
+        def column_type(dtype):
+            if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+                return 'INTEGER'
+            if pd.api.types.is_float_dtype(dtype):
+                return 'REAL'
+            return 'TEXT'
+
+        columns = ', '.join(f'"{column}" {column_type(dtype)}' for column, dtype in speed_df.dtypes.items())
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({columns})')
+
+        for name, index_columns in self.indexes.get(table, {}).items():
+            index_columns = [column for column in index_columns if column in speed_df.columns]
+            if index_columns:
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS "{table}_{name}" ON "{table}" '
+                                        f'({", ".join(f"{chr(34)}{column}{chr(34)}" for column in index_columns)})')
+
+    def insert(self, table, speed_df):
+        """
+        Inserts the rows of speed_df in batches. Missing values are stored as NULL.
+        """
+        columns = ', '.join(f'"{column}"' for column in speed_df.columns)
+        statement = f'INSERT INTO "{table}" ({columns}) VALUES ({", ".join("?"*len(speed_df.columns))})'
+
+        for start in range(0, len(speed_df), self.batch_size):
+            #Python objects, so sqlite3 can bind them (numpy scalars can't be)
+            batch = speed_df.iloc[start:start + self.batch_size].astype(object)
+            batch = batch.where(batch.notna(), None)
+            self.connection.executemany(statement, batch.itertuples(index=False, name=None))
+
+    def write(self, table, speed_df, replace=None):
+        """
+        Writes speed_df to 'table', in one transaction.
+        Rows to replace are deleted first: all rows if replace is None, otherwise rows whose value in
+        each column of the 'replace' dict is one of the given values (eg {'Monster':['Alatreon']}).
+        """
+        with self.connection:
+            if table in self.tables():
+                if replace is None:
+                    self.connection.execute(f'DELETE FROM "{table}"')
+                else:
+                    where, params = self.where_clause(replace)
+                    self.connection.execute(f'DELETE FROM "{table}" WHERE {where}', params)
+
+            self.create_table(table, speed_df)
+            self.insert(table, speed_df)
+
+    def analyze(self):
+        """
+        Updates the statistics of the query planner, so it can skip-scan the Ruleset column of the
+        indexes when a query doesn't filter by ruleset. Run after large writes.
+        """
+        self.connection.execute('ANALYZE')
+
+    def write_runs(self, mon_df):
+        """
+        Writes runs gathered by gather_speedrun, replacing the runs of the same monsters
+        """
+        self.write('runs', mon_df, replace={'Monster': mon_df['Monster'].unique().tolist()})
+
+    def write_rankings(self, freestyle, ta):
+        """
+        Writes the freestyle and TA rankings, replacing the previous ones
+        """
+        self.write('freestyle', freestyle)
+        self.write('ta', ta)
+        self.analyze()
+
+    def write_runner_stats(self, stats_df):
+        """
+        Writes the statistics of RunnerStats.table, one row per (Ruleset, Runner), replacing the previous ones
+        """
+        self.write('runner_stats', stats_df.reset_index())
+        self.analyze()
+
+    def where_clause(self, conditions):
+        """
+        SQL condition and parameters for a dict of column --> value or list of values
+        """
+        clauses = []
+        params = []
+        for column, values in conditions.items():
+            if isinstance(values, (list, tuple, set, np.ndarray, pd.Index, pd.Series)):
+                values = list(values)
+                clauses.append(f'"{column}" IN ({", ".join("?"*len(values))})')
+                params.extend(values)
+            else:
+                clauses.append(f'"{column}" = ?')
+                params.append(values)
+
+        return (' AND '.join(clauses) if clauses else '1', params)
+
+    def query(self, table, columns=None, min_time=None, max_time=None, **filters):
+        """
+        Returns the rows of 'table' matching every filter, as a DataFrame with the columns and types
+        the analysis functions expect, in the order they were written.
+        Filters are star_rating, monster, quest, runner, weapon, platform and ruleset, each a value
+        or a list of values, and min_time/max_time (in seconds) for the rankings. Eg:
+            store.query('freestyle', ruleset='TA Rules', monster='Alatreon', weapon=['HBG','LBG'])
+        """
+        conditions = {}
+        for name, values in filters.items():
+            if name not in filter_columns:
+                raise Exception(f"Unknown filter '{name}', use one of {list(filter_columns)}")
+            conditions[filter_columns[name]] = values
+
+        where, params = self.where_clause(conditions)
+        if min_time is not None:
+            where += ' AND "Time (s)" >= ?'
+            params.append(min_time)
+        if max_time is not None:
+            where += ' AND "Time (s)" <= ?'
+            params.append(max_time)
+
+        columns = columns or self.columns(table)
+        select = ', '.join(f'"{column}"' for column in columns)
+
+        speed_df = pd.read_sql_query(f'SELECT {select} FROM "{table}" WHERE {where} ORDER BY rowid',
+                                     self.connection, params=params)
+
+        #Same types as the rankings from make_rankings
+        for column in speed_df.columns:
+            if column == 'Weapon':
+                #Short names, in the order of make_rankings (sorted by long name)
+                weapons = sorted(speed_df[column].dropna().unique(), key=lambda weapon: inv_weapon_dict.get(weapon, weapon))
+                speed_df[column] = pd.Categorical(speed_df[column], categories=weapons)
+            elif column in category_columns:
+                speed_df[column] = speed_df[column].astype('category')
+            elif column in rank_groups:
+                speed_df[column] = speed_df[column].astype(np.int64)
+
+        return speed_df
@@ -0,0 +1,245 @@
+"""
+Runner statistics, built once from the rankings of make_rankings.
+
+Usage:
+    python runner_stats.py [--ruleset TA] [--by "First places"] [--top 20] [--runner NAME] [--rival NAME]
+                           [--filter-by Quest] [--storage csv] [--db FILE]
+
+Prints the leaderboard of runners sorted by one statistic, or the statistics and head-to-head
+of one runner, against every rival or against --rival. --db also writes the table to a RunStore.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from make_rankings import load_rankings, storage_extensions
+
+#Statistics of each runner, in the order of the columns of RunnerStats.table
+stat_columns = ['Runs','Quests','Monsters','First places','Podiums','Weapon firsts','Median rank','Best rank',
+                'Weapons','Main weapon','Main weapon share']
+
+def distinct_pairs(codes, other_codes, n_other):
+    """
+    Distinct (code, other code) pairs, as sorted keys code*n_other + other code, and the rows of each
+    """
+    keys = np.sort(codes.astype(np.int64)*n_other + other_codes)
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    first = np.flatnonzero(first)
+
+    return (keys[first], np.diff(np.r_[first, len(keys)]))
+
+class RunnerStats:
+    """
+    Statistics of every runner, for each ruleset, precomputed in grouped passes over the rankings.
+    Places and ranks are per quest, or per monster with filter_by='Monster':
+        Runs              --> ranked runs of the runner
+        Quests, Monsters  --> quests and monsters with at least one run
+        First places      --> quests where the runner holds rank 1 (Quest/General)
+        Podiums           --> quests where the runner is ranked 3 or better
+        Weapon firsts     --> (quest, weapon) pairs where the runner holds rank 1 (Quest/Weapon)
+        Median rank       --> median of the best rank of the runner on each quest
+        Best rank         --> best rank on any quest
+        Weapons           --> weapons used
+        Main weapon       --> weapon with the most runs, and the share of the runs made with it
+    All of them are in 'table', indexed by (ruleset, runner), so lookups are a single index access.
+    The best time of each runner on each quest is kept sorted by runner and by quest, so head-to-head
+    records only read the quests of the runner:
+        stats = RunnerStats({'Freestyle':freestyle,'TA':ta})
+        stats.leaderboard('TA', by='First places', top=10)
+        stats.head_to_head('TA', 'DEVA')
+    """
+
+    def __init__(self, rankings, filter_by='Quest', weapon_column='Weapon', runner_column='Runner',
+                 time_column='Time (s)'):
+        self.filter_by = filter_by
+        self.runner_column = runner_column
+        self.time_column = time_column
+
+        #Keyed by ruleset
+        self.runners = {}     #Runner names, in code order
+        self.groups = {}      #Quest (or monster) names, in code order
+        self.best = {}        #Best time and rank of each (runner, quest), sorted by runner then quest
+        self.by_runner = {}   #Start of the rows of each runner in best, plus the end
+        self.by_group = {}    #Order of best sorted by quest then time, and start of each quest, plus the end
+
+        tables = []
+        for ruleset, speed_df in rankings.items():
+            tables.append(self.make_table(ruleset, speed_df, weapon_column))
+
+        self.table = pd.concat(tables, keys=list(rankings), names=['Ruleset', runner_column])
+
+    def make_table(self, ruleset, speed_df, weapon_column):
+        """
+        Statistics of every runner of one ruleset, indexed by runner. Also fills the best times of the ruleset.
+        """
+        general_column = self.filter_by + '/General'
+        weapon_rank_column = self.filter_by + '/Weapon'
+
+        #Integer codes, so every aggregate is a bincount or a sort on integers
+        runner_codes, runners = pd.factorize(speed_df[self.runner_column], sort=True)
+        group_codes, groups = pd.factorize(speed_df[self.filter_by], sort=True)
+        quest_codes, quests = pd.factorize(speed_df['Quest'], sort=True)
+        monster_codes, monsters = pd.factorize(speed_df['Monster'], sort=True)
+        weapon_codes, weapons = pd.factorize(speed_df[weapon_column], sort=True)
+        general_ranks = speed_df[general_column].to_numpy(dtype=np.int64)
+        weapon_ranks = speed_df[weapon_rank_column].to_numpy(dtype=np.int64)
+        times = speed_df[self.time_column].to_numpy(dtype=np.float64)
+        n_runners = len(runners)
+
+        #Best run of each (runner, quest): sort by runner, quest and rank in one key, and keep the first of each pair
+        pair_keys = runner_codes.astype(np.int64)*len(groups) + group_codes
+        order = np.argsort(pair_keys*(general_ranks.max(initial=0) + 1) + general_ranks)
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pair_keys[order][1:] != pair_keys[order][:-1]
+        order = order[first]
+        best = pd.DataFrame({'Runner': runner_codes[order].astype(np.int32),
+                             'Group': group_codes[order].astype(np.int32),
+                             'Rank': general_ranks[order].astype(np.int32),
+                             'Time': times[order]})
+
+        pair_counts = np.bincount(best['Runner'], minlength=n_runners)
+        best_ranks = best['Rank'].to_numpy()
+
+        #Median of the best ranks: ranks sorted within each runner, then the middle one or two of each
+        starts = np.concatenate([[0], np.cumsum(pair_counts)])
+        rank_limit = best_ranks.max(initial=0) + 1
+        sorted_ranks = np.sort(best['Runner'].to_numpy(dtype=np.int64)*rank_limit + best_ranks) % rank_limit
+        low = sorted_ranks[starts[:-1] + (pair_counts - 1)//2]
+        high = sorted_ranks[starts[:-1] + pair_counts//2]
+
+        #Distinct (runner, quest), (runner, monster) and (runner, weapon) pairs
+        quest_pairs, _ = distinct_pairs(runner_codes, quest_codes, len(quests))
+        monster_pairs, _ = distinct_pairs(runner_codes, monster_codes, len(monsters))
+        weapon_pairs, weapon_counts = distinct_pairs(runner_codes, weapon_codes, len(weapons))
+        weapon_runners = weapon_pairs//len(weapons)
+
+        #Main weapon: most runs, ties go to the first weapon in order. Pairs are sorted by runner then weapon,
+        #so a stable sort by count (descending) keeps the first weapon of each runner in front
+        main = np.lexsort((-weapon_counts, weapon_runners))
+        first = np.ones(len(main), dtype=bool)
+        first[1:] = weapon_runners[main][1:] != weapon_runners[main][:-1]
+        main = main[first]
+
+        runs = np.bincount(runner_codes, minlength=n_runners)
+        table = pd.DataFrame({
+            'Runs': runs.astype(np.int32),
+            'Quests': np.bincount(quest_pairs//len(quests), minlength=n_runners).astype(np.int32),
+            'Monsters': np.bincount(monster_pairs//len(monsters), minlength=n_runners).astype(np.int32),
+            'First places': np.bincount(best['Runner'], weights=best_ranks==1, minlength=n_runners).astype(np.int32),
+            'Podiums': np.bincount(best['Runner'], weights=best_ranks<=3, minlength=n_runners).astype(np.int32),
+            'Weapon firsts': np.bincount(runner_codes, weights=weapon_ranks==1, minlength=n_runners).astype(np.int32),
+            'Median rank': ((low + high)/2).astype(np.float32),
+            'Best rank': sorted_ranks[starts[:-1]].astype(np.int32),
+            'Weapons': np.bincount(weapon_runners, minlength=n_runners).astype(np.int32),
+            'Main weapon': pd.Categorical.from_codes(weapon_pairs[main] % len(weapons), categories=np.asarray(weapons)),
+            'Main weapon share': (weapon_counts[main]/runs).astype(np.float32)},
+            index=pd.Index(np.asarray(runners), name=self.runner_column))
+
+        #Best times, found by runner (they are already in that order) or by quest
+        group_order = np.lexsort((best['Time'].to_numpy(), best['Group'].to_numpy())).astype(np.int32)
+        group_counts = np.bincount(best['Group'], minlength=len(groups))
+
+        self.runners[ruleset] = runners
+        self.groups[ruleset] = groups
+        self.best[ruleset] = best
+        self.by_runner[ruleset] = starts
+        self.by_group[ruleset] = (group_order, np.concatenate([[0], np.cumsum(group_counts)]))
+
+        return table
+
+    def runner(self, ruleset, runner):
+        """
+        Statistics of one runner, as a Series
+        """
+        self.runner_code(ruleset, runner)
+        return self.table.loc[(ruleset, runner)]
+
+    def leaderboard(self, ruleset, by='First places', top=None, ascending=None):
+        """
+        Runners of a ruleset sorted by one statistic, best first (most first places, lowest median rank...).
+        Ties are broken by the number of runs. Returns the 'top' best runners, or all if top is None.
+        """
+        if ascending is None:
+            ascending = by in ['Median rank','Best rank']
+
+        stats_df = self.table.loc[ruleset].sort_values([by, 'Runs'], ascending=[ascending, False], kind='stable')
+
+        return stats_df if top is None else stats_df.head(top)
+
+    def runner_code(self, ruleset, runner):
+        code = self.runners[ruleset].get_indexer([runner])[0]
+        if code < 0:
+            raise Exception(f"Runner '{runner}' has no runs in {ruleset}")
+        return code
+
+    def head_to_head(self, ruleset, runner, rival=None):
+        """
+        Record of a runner against every other runner on the quests they both ran: quests in common,
+        and wins, losses and ties comparing the best time of each runner on each of them.
+        Returns a DataFrame indexed by rival, sorted by quests in common, or a Series if 'rival' is given.
+        """
+        best = self.best[ruleset]
+        group_order, group_starts = self.by_group[ruleset]
+
+        #Quests and best times of the runner
+        code = self.runner_code(ruleset, runner)
+        start, end = self.by_runner[ruleset][code:code + 2]
+        own_groups = best['Group'].to_numpy()[start:end]
+        own_times = best['Time'].to_numpy()[start:end]
+
+        #Rows of every runner on those quests, with the time of the runner on the same quest
+        sizes = group_starts[own_groups + 1] - group_starts[own_groups]
+        offsets = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        rows = group_order[np.repeat(group_starts[own_groups], sizes) + offsets]
+        rivals = best['Runner'].to_numpy()[rows]
+        difference = best['Time'].to_numpy()[rows] - np.repeat(own_times, sizes)
+
+        keep = rivals != code
+        if rival is not None:
+            keep &= rivals == self.runner_code(ruleset, rival)
+        rivals, difference = rivals[keep], difference[keep]
+
+        #Lower time wins
+        n_runners = len(self.runners[ruleset])
+        record = pd.DataFrame({'Quests': np.bincount(rivals, minlength=n_runners),
+                               'Wins': np.bincount(rivals, weights=difference > 0, minlength=n_runners),
+                               'Losses': np.bincount(rivals, weights=difference < 0, minlength=n_runners),
+                               'Ties': np.bincount(rivals, weights=difference == 0, minlength=n_runners)},
+                              index=pd.Index(self.runners[ruleset], name=self.runner_column)).astype(np.int32)
+
+        if rival is not None:
+            return record.loc[rival]
+
+        record = record[record['Quests'] > 0]
+        return record.sort_values(['Quests','Wins'], ascending=False, kind='stable')
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Statistics and head-to-head records of the runners')
+    arg_parser.add_argument('--ruleset', default='TA', choices=['Freestyle','TA'], help='rankings to use')
+    arg_parser.add_argument('--by', default='First places', choices=stat_columns, help='statistic to sort the runners by')
+    arg_parser.add_argument('--top', type=int, default=20, help='runners in the leaderboard')
+    arg_parser.add_argument('--runner', default=None, help='print the statistics and head-to-head of this runner')
+    arg_parser.add_argument('--rival', default=None, help='only the head-to-head against this runner')
+    arg_parser.add_argument('--filter-by', default='Quest', choices=['Quest','Monster'], help='count runs per quest or per monster')
+    arg_parser.add_argument('--storage', default='csv', choices=list(storage_extensions), help='storage of the rankings')
+    arg_parser.add_argument('--db', default=None, help='also write the statistics to this SQLite RunStore')
+    args = arg_parser.parse_args()
+
+    stats = RunnerStats({'Freestyle': load_rankings('freestyle', args.storage), 'TA': load_rankings('ta', args.storage)},
+                        filter_by=args.filter_by)
+
+    if args.runner is None:
+        print(stats.leaderboard(args.ruleset, by=args.by, top=args.top).to_string())
+    else:
+        print(stats.runner(args.ruleset, args.runner).to_string())
+        print()
+        record = stats.head_to_head(args.ruleset, args.runner, args.rival)
+        print(record.to_string() if args.rival is not None else record.head(args.top).to_string())
+
+    if args.db is not None:
+        from run_store import RunStore
+        store = RunStore(args.db)
+        store.write_runner_stats(stats.table)
+        store.close()
@@ -0,0 +1,87 @@
+"""
+AnalysisCache across processes, and the side effects of cached make_rankings
+"""
+import os
+import sys
+import json
+import subprocess
+
+import pandas as pd
+
+#Make the modules in the repository root and the benchmarks importable
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'benchmarks'))
+
+from generate_data import generate_runs
+import make_rankings as rankings
+from analysis_cache import AnalysisCache
+
+#Makes the rankings with a disk cache, in a fresh interpreter, and prints the hits and misses
+ranking_script = '''
+import json
+from analysis_cache import analysis_cache
+import analysis_cache as cached
+
+analysis_cache.cache_dir = 'cache'
+freestyle, ta = cached.make_rankings('runs.csv')
+cached.filter_by_weapon(freestyle)
+print(json.dumps([analysis_cache.hits, analysis_cache.misses]))
+'''
+
+def pkl_files(cache_dir):
+    return [file_name for file_name in os.listdir(cache_dir) if file_name.endswith('.pkl')]
+
+def run_rankings(work_dir):
+    output = subprocess.run([sys.executable, '-c', ranking_script], cwd=work_dir, check=True, capture_output=True,
+                            text=True, env=dict(os.environ, PYTHONPATH=root)).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def test_make_rankings_hits_the_disk_cache_and_saves_the_rankings(tmp_path):
+    generate_runs(2000, n_monsters=5, seed=3).to_csv(tmp_path / 'runs.csv', index=False)
+    os.makedirs(tmp_path / 'cache')
+
+    assert run_rankings(tmp_path) == [0, 2]
+    expected = pd.read_csv(tmp_path / 'freestyle.csv')
+
+    #A cache hit still writes the rankings
+    os.remove(tmp_path / 'freestyle.csv')
+    os.remove(tmp_path / 'ta.csv')
+
+    assert run_rankings(tmp_path) == [2, 0]
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / 'freestyle.csv'), expected)
+    assert os.path.exists(tmp_path / 'ta.csv')
+
+def test_changed_source_removes_stale_results_on_disk(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    generate_runs(2000, n_monsters=5, seed=3).to_csv('runs.csv', index=False)
+
+    cache = AnalysisCache(cache_dir='cache')
+    freestyle, ta = cache.memoize(rankings.make_rankings, ignore=('profiler','store'))('runs.csv')
+    cache.memoize(rankings.filter_by_weapon)(freestyle)
+    assert len(pkl_files('cache')) == 2
+
+    #A new session, which never loaded the old results, sees the file change
+    generate_runs(2000, n_monsters=5, seed=4).to_csv('runs.csv', index=False)
+    cache = AnalysisCache(cache_dir='cache')
+    cache.memoize(rankings.make_rankings, ignore=('profiler','store'))('runs.csv')
+
+    assert cache.misses == 1
+    assert len(pkl_files('cache')) == 1
+
+def test_disk_keeps_the_most_recently_used_results(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    cache = AnalysisCache(max_entries=1, cache_dir=cache_dir, max_disk_entries=2)
+    to_seconds = cache.memoize(rankings.to_seconds)
+
+    for time_str in ['01\'00"00', '02\'00"00', '01\'00"00', '03\'00"00']:
+        to_seconds(time_str)
+    assert len(pkl_files(cache_dir)) == 2
+
+    #In a new session, the least recently used result (02'00"00) has to be computed again
+    cache = AnalysisCache(cache_dir=cache_dir, max_disk_entries=2)
+    to_seconds = cache.memoize(rankings.to_seconds)
+    for time_str in ['01\'00"00', '03\'00"00', '02\'00"00']:
+        to_seconds(time_str)
+
+    assert [cache.hits, cache.misses] == [2, 1]
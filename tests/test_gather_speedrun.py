@@ -0,0 +1,182 @@
+"""
+gather_speedrun against a local copy of the leaderboards, served by http.server
+"""
+import os
+import sys
+import time
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pandas as pd
+import pytest
+
+#Make the modules in the repository root and the benchmarks importable
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'benchmarks'))
+
+from generate_data import generate_runs, write_pages
+from gather_speedrun import (gather_speedrun, parse_monster_links, IBSpeedrunTableParser, PageCache,
+                             StreamingCsvWriter)
+
+#Seconds to wait before answering a request for each of these paths
+slow_paths = {}
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(slow_paths.get(self.path, 0))
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def site(tmp_path):
+    """
+    Directory with a fake copy of the leaderboards, and the url of a local server for it
+    """
+    page_dir = str(tmp_path / 'site')
+    write_pages(generate_runs(3000, n_monsters=6, seed=1), page_dir)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=page_dir))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield (page_dir, f'http://127.0.0.1:{server.server_address[1]}/')
+
+    slow_paths.clear()
+    server.shutdown()
+    server.server_close()
+
+def expected_rows(page_dir, main_url):
+    """
+    Rows of every monster page, parsed straight from the files with parse_page
+    """
+    with open(os.path.join(page_dir, 'index.html'), 'rb') as f:
+        link_df = parse_monster_links(f.read(), main_url)
+
+    parser = IBSpeedrunTableParser()
+    frames = []
+    for monster, star_rating, link in link_df.itertuples(index=False):
+        with open(os.path.join(page_dir, link[len(main_url):]), 'rb') as f:
+            mon_df = parser.parse_page(f.read())
+
+        mon_df.insert(0, 'Monster', monster)
+        mon_df.insert(0, 'Star Rating', star_rating)
+        frames.append(mon_df)
+
+    return pd.concat(frames, ignore_index=True)
+
+def read_output(output_file):
+    return pd.read_csv(output_file, dtype=str, keep_default_na=False)
+
+def test_gather_matches_parse_page(site, tmp_path):
+    page_dir, main_url = site
+    output_file = str(tmp_path / 'speedrun_data.csv')
+
+    gather_speedrun(main_url=main_url, output_file=output_file, rate=1000, burst=100)
+
+    pd.testing.assert_frame_equal(read_output(output_file), expected_rows(page_dir, main_url), check_dtype=False)
+    assert not os.path.exists(output_file + '.partial')
+
+def test_error_does_not_wait_for_queued_downloads(site, tmp_path):
+    page_dir, main_url = site
+    output_file = str(tmp_path / 'speedrun_data.csv')
+
+    #First monster page with more column titles than columns
+    with open(os.path.join(page_dir, 'index.html'), 'rb') as f:
+        links = parse_monster_links(f.read(), main_url)['Link'].tolist()
+    with open(os.path.join(page_dir, links[0][len(main_url):]), 'w', encoding='utf-8') as f:
+        f.write('<html><body><table><tr><th>Quest</th><th>Runner</th></tr><tr><td>Quest 0</td></tr></table></body></html>')
+
+    #The other pages take 3 s each, so waiting for the ones being downloaded would take at least 3 s
+    for link in links[1:]:
+        slow_paths[link[len(main_url) - 1:]] = 3
+
+    start = time.monotonic()
+    with pytest.raises(Exception, match='Column titles'):
+        gather_speedrun(main_url=main_url, output_file=output_file, max_workers=3, rate=1000, burst=100)
+
+    assert time.monotonic() - start < 2
+
+def test_failed_crawl_does_not_keep_stale_pages(site, tmp_path):
+    page_dir, main_url = site
+    output_file = str(tmp_path / 'speedrun_data.csv')
+    cache_dir = str(tmp_path / 'cache')
+
+    gather_speedrun(main_url=main_url, output_file=output_file, rate=1000, burst=100, cache_dir=cache_dir)
+
+    #New version of every page, newer than the cached one (http.server compares modification times in seconds)
+    write_pages(generate_runs(3000, n_monsters=6, seed=2), page_dir)
+    later = time.time() + 10
+    for directory, _, files in os.walk(page_dir):
+        for name in files:
+            os.utime(os.path.join(directory, name), (later, later))
+
+    with open(os.path.join(page_dir, 'index.html'), 'rb') as f:
+        first_page = os.path.join(page_dir, parse_monster_links(f.read(), main_url)['Link'].iat[0][len(main_url):])
+    with open(first_page, encoding='utf-8') as f:
+        good_page = f.read()
+
+    #The crawl fails on the first page, while all the other pages are being downloaded
+    with open(first_page, 'w', encoding='utf-8') as f:
+        f.write('<html><body><table><tr><th>Quest</th><th>Runner</th></tr><tr><td>Quest 0</td></tr></table></body></html>')
+    os.utime(first_page, (later, later))
+
+    with pytest.raises(Exception, match='Column titles'):
+        gather_speedrun(main_url=main_url, output_file=output_file, max_workers=6, rate=1000, burst=100,
+                        cache_dir=cache_dir)
+
+    with open(first_page, 'w', encoding='utf-8') as f:
+        f.write(good_page)
+    os.utime(first_page, (later + 10, later + 10))
+
+    gather_speedrun(main_url=main_url, output_file=output_file, rate=1000, burst=100, cache_dir=cache_dir)
+
+    pd.testing.assert_frame_equal(read_output(output_file), expected_rows(page_dir, main_url), check_dtype=False)
+
+def test_page_cache_only_records_pages_with_rows(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    url = 'http://127.0.0.1/monster/monster-0'
+
+    cache = PageCache(cache_dir)
+    assert cache.store(url, b'v1', etag='"1"')
+    cache.store_rows(url, pd.DataFrame({'Runner': ['A']}))
+    cache.save()
+
+    #New version downloaded, but the crawl fails before its rows are stored
+    cache = PageCache(cache_dir)
+    assert cache.store(url, b'v2', etag='"2"')
+    cache.save()
+
+    #The page still counts as changed, and the cache still holds the first version with its rows
+    cache = PageCache(cache_dir)
+    assert cache.conditional_headers(url)['If-None-Match'] == '"1"'
+    assert cache.load(url) == b'v1'
+    assert cache.store(url, b'v2', etag='"2"')
+    assert not cache.store(url, b'v1', etag='"1"')
+    assert cache.load_rows(url)['Runner'].tolist() == ['A']
+
+def test_slow_page_does_not_hold_every_later_page(site, tmp_path, monkeypatch):
+    page_dir, main_url = site
+    output_file = str(tmp_path / 'speedrun_data.csv')
+
+    with open(os.path.join(page_dir, 'index.html'), 'rb') as f:
+        first_link = parse_monster_links(f.read(), main_url)['Link'].iat[0]
+    slow_paths[first_link[len(main_url) - 1:]] = 1
+
+    #Largest number of pages waiting for the monsters before them
+    largest = []
+    add = StreamingCsvWriter.add
+
+    def recording_add(self, position, mon_df):
+        largest.append(len(self.pending) + 1)
+        add(self, position, mon_df)
+
+    monkeypatch.setattr(StreamingCsvWriter, 'add', recording_add)
+
+    gather_speedrun(main_url=main_url, output_file=output_file, max_workers=2, rate=1000, burst=100)
+
+    assert max(largest) <= 2
+    pd.testing.assert_frame_equal(read_output(output_file), expected_rows(page_dir, main_url), check_dtype=False)
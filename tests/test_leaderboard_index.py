@@ -0,0 +1,42 @@
+"""
+LeaderboardIndex queries against the DataFrame functions
+"""
+import os
+import sys
+
+import pytest
+
+#Make the modules in the repository root and the benchmarks importable
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'benchmarks'))
+
+from generate_data import generate_runs
+from make_rankings import prepare_runs, rank_runs, average_top_runs
+from leaderboard_index import LeaderboardIndex
+
+@pytest.fixture(scope='module')
+def freestyle():
+    freestyle = prepare_runs(generate_runs(3000, n_monsters=5, seed=6))
+    ranks = rank_runs(freestyle)
+    freestyle[list(ranks.columns)] = ranks
+    return freestyle
+
+def test_average_top_matches_average_top_runs(freestyle):
+    index = LeaderboardIndex({'Freestyle': freestyle})
+
+    for top_pos in [1, 3, 5]:
+        expected = average_top_runs(freestyle, 'Quest/Weapon', top_pos=top_pos)[['Weapon','Time (s)']]
+        result = index.average_top('Freestyle', 'Quest/Weapon', top_pos=top_pos)
+        #Averages falling on a half centisecond may round differently
+        expected = dict(zip(expected['Weapon'].astype(str), expected['Time (s)']))
+        assert dict(zip(result['Weapon'], result['Time (s)'])) == pytest.approx(expected, abs=0.011)
+
+def test_top_pos_must_select_a_run(freestyle):
+    index = LeaderboardIndex({'Freestyle': freestyle})
+    monster = freestyle['Monster'].iat[0]
+
+    with pytest.raises(Exception, match='top_pos'):
+        index.top_average('Freestyle', 'Monster', monster, top_pos=0)
+    with pytest.raises(Exception, match='top_pos'):
+        index.average_top('Freestyle', 'Monster/General', top_pos=-1)
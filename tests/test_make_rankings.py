@@ -0,0 +1,53 @@
+"""
+Time parsing and preparation of the runs
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+#Make the modules in the repository root and the benchmarks importable
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'benchmarks'))
+
+from generate_data import generate_runs
+from make_rankings import to_seconds, to_time_string, prepare_runs, make_rankings, save_rankings, load_rankings
+
+def test_to_seconds():
+    times = ['04\'59"99', '1:05\'00"00', '1h5\'00"00', '75\'00"00', '12′34″56', ' 01\'02"03 ']
+    np.testing.assert_allclose(to_seconds(times), [299.99, 3900, 3900, 4500, 754.56, 62.03])
+
+def test_to_seconds_rejects_out_of_range_fields():
+    times = ['04\'70"00', '04\'60"00', '1:60\'00"00', '1:123\'00"00', '04\'5"00', 'DNF', None]
+    assert to_seconds(times).isna().all()
+
+def test_to_time_string_round_trip():
+    times = pd.Series(['00\'59"99', '04\'05"10', '75\'00"00'])
+    pd.testing.assert_series_equal(to_time_string(to_seconds(times)), times, check_dtype=False)
+
+def test_prepare_runs_skips_malformed_times(capsys):
+    runs = generate_runs(200, n_monsters=2, seed=7)
+    #Rows kept by the removal of repeat runs
+    rows = runs.drop_duplicates(['Monster','Quest','Runner','Weapon']).index[:2]
+    runs.loc[rows, 'Time'] = ['04\'70"00', '1:60\'00"00']
+
+    prepared = prepare_runs(runs)
+
+    assert 'Skipping 2 runs with malformed times' in capsys.readouterr().out
+    assert prepared['Time (s)'].notna().all()
+    assert not prepared['Time'].isin(['04\'70"00', '1:60\'00"00']).any()
+
+def test_columnar_storage_keeps_times(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runs = generate_runs(5000, n_monsters=5, seed=8)
+    runs.to_csv('runs.csv', index=False)
+    freestyle, ta = make_rankings('runs.csv')
+
+    for storage in ['parquet','feather']:
+        save_rankings(freestyle, 'stored', storage)
+        loaded = load_rankings('stored', storage)
+
+        assert loaded['Time (s)'].dtype == np.float64
+        np.testing.assert_array_equal(loaded['Time (s)'].to_numpy(), freestyle['Time (s)'].to_numpy())
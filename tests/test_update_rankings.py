@@ -0,0 +1,105 @@
+"""
+update_rankings against a full rebuild of the rankings
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+#Make the modules in the repository root and the benchmarks importable
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'benchmarks'))
+
+from generate_data import generate_runs
+from make_rankings import (prepare_runs, rank_runs, assemble_rankings, update_rankings, rank_groups, run_key,
+                           save_rankings, load_rankings)
+
+def rank_all(runs):
+    """
+    Rankings of runs in the format of speedrun_data.csv, as make_rankings makes them
+    """
+    freestyle = prepare_runs(runs)
+    is_ta = freestyle['Ruleset']=='TA Rules'
+    ta_ranks = rank_runs(freestyle, mask=is_ta)
+
+    return assemble_rankings(freestyle, rank_runs(freestyle), ta_ranks)
+
+def ranks_by_run(speed_df):
+    """
+    Time and ranks of each run, indexed by run and sorted, with plain string keys
+    """
+    speed_df = speed_df.astype({column: str for column in run_key})
+    return speed_df.set_index(run_key)[['Time (s)'] + list(rank_groups)].sort_index()
+
+def test_empty_batch_keeps_the_rankings():
+    freestyle, ta = rank_all(generate_runs(2000, n_monsters=5, seed=4))
+
+    new_freestyle, new_ta, changes = update_rankings(freestyle.copy(), ta.copy(), generate_runs(2000).iloc[:0])
+
+    pd.testing.assert_frame_equal(new_freestyle, freestyle)
+    pd.testing.assert_frame_equal(new_ta, ta)
+    assert changes.empty
+    assert list(changes.columns) == ['Ruleset'] + run_key + ['Rank','Old Rank','New Rank']
+
+def test_held_out_runs_added_back_match_a_full_rebuild():
+    runs = generate_runs(20000, n_monsters=10, seed=5)
+    held_out = np.random.default_rng(0).random(len(runs)) < 0.03
+
+    freestyle, ta = rank_all(runs[~held_out].reset_index(drop=True))
+    freestyle, ta, changes = update_rankings(freestyle, ta, runs[held_out].reset_index(drop=True))
+    full_freestyle, full_ta = rank_all(runs)
+
+    for updated, full in [(freestyle, full_freestyle), (ta, full_ta)]:
+        #Same display order as sort_runs (runs tied on every sort column may be in any order)
+        sort_columns = ['Star Rating','Monster','Time (s)','Quest']
+        pd.testing.assert_frame_equal(updated[sort_columns].astype(str), full[sort_columns].astype(str))
+
+        updated, full = ranks_by_run(updated), ranks_by_run(full)
+        pd.testing.assert_index_equal(updated.index, full.index)
+        np.testing.assert_array_equal(updated['Time (s)'], full['Time (s)'])
+
+        #A new run ranks after an existing run with the same time, so ranks may only differ between tied runs
+        for rank_column, group_columns in rank_groups.items():
+            groups = full.reset_index()[group_columns + ['Time (s)']]
+            tied = groups.duplicated(keep=False).to_numpy()
+            np.testing.assert_array_equal(updated[rank_column].to_numpy()[~tied], full[rank_column].to_numpy()[~tied])
+
+    assert not changes.empty
+    assert set(changes['Ruleset']) == {'Freestyle','TA'}
+
+def test_resubmitted_runs_change_nothing_on_stored_rankings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runs = generate_runs(3000, n_monsters=5, seed=9)
+    freestyle, ta = rank_all(runs)
+
+    for storage in ['parquet','feather']:
+        save_rankings(freestyle, 'freestyle', storage)
+        save_rankings(ta, 'ta', storage)
+
+        #The same runs again, with the same times
+        new_freestyle, new_ta, changes = update_rankings(load_rankings('freestyle', storage),
+                                                         load_rankings('ta', storage), runs.iloc[:50])
+
+        assert changes.empty
+        pd.testing.assert_frame_equal(ranks_by_run(new_freestyle), ranks_by_run(freestyle), check_dtype=False)
+
+def test_csv_rankings_update_like_rankings_in_memory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runs = generate_runs(3000, n_monsters=5, seed=10)
+    freestyle, ta = rank_all(runs)
+    save_rankings(freestyle, 'freestyle', 'csv')
+    save_rankings(ta, 'ta', 'csv')
+
+    #Runs of a new runner, on every monster
+    new_runs = runs.groupby('Monster').head(4).assign(Runner='New runner').reset_index(drop=True)
+
+    memory_freestyle, memory_ta, memory_changes = update_rankings(freestyle, ta, new_runs)
+    csv_freestyle, csv_ta, csv_changes = update_rankings(load_rankings('freestyle'), load_rankings('ta'), new_runs)
+
+    assert len(csv_changes) == len(memory_changes)
+    for csv_df, memory_df in [(csv_freestyle, memory_freestyle), (csv_ta, memory_ta)]:
+        #Same runs in the same display order, with the same ranks
+        pd.testing.assert_frame_equal(csv_df[run_key].astype(str), memory_df[run_key].astype(str))
+        pd.testing.assert_frame_equal(ranks_by_run(csv_df), ranks_by_run(memory_df), check_dtype=False)